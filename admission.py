@@ -0,0 +1,139 @@
+"""
+Admission control in front of the Groq call.
+
+Only turns that actually need the LLM pass through here – KB-direct and
+cached answers never wait. Two checks, in order:
+
+    per client   token bucket per session / IP: CLIENT_RPM calls a minute,
+                 CLIENT_BURST at once, so one client cannot crowd out the rest
+    global       at most MAX_IN_FLIGHT Groq calls per process; up to
+                 ADMISSION_QUEUE more wait (at most ADMISSION_WAIT seconds)
+                 for a slot, anything beyond is turned away immediately
+
+Turns coalesced onto another request's call (coalesce.py) still pay their own
+client's token, though they take no slot.
+
+A turned-away request raises AdmissionDenied; ChatEngine then serves the
+KB-only reply (VMITRA_ADMISSION_OVERFLOW=degrade, the default) or lets the
+error through so the API can answer 429 / 503 (=reject).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import REGISTRY
+
+MAX_IN_FLIGHT   = int(os.getenv("VMITRA_MAX_IN_FLIGHT", "16"))      # 0 = no admission control
+ADMISSION_QUEUE = int(os.getenv("VMITRA_ADMISSION_QUEUE", "64"))
+ADMISSION_WAIT  = float(os.getenv("VMITRA_ADMISSION_WAIT", "10"))   # seconds
+CLIENT_RPM      = float(os.getenv("VMITRA_CLIENT_RPM", "20"))       # 0 = no per-client limit
+CLIENT_BURST    = int(os.getenv("VMITRA_CLIENT_BURST", "5"))
+OVERFLOW        = os.getenv("VMITRA_ADMISSION_OVERFLOW", "degrade")  # degrade | reject
+MAX_CLIENTS     = 10000     # token buckets kept (least recently seen dropped first)
+
+# queue wait is the "admission" stage of vmitra_stage_seconds (timed by ChatEngine)
+ADMISSIONS = REGISTRY.counter("vmitra_admission_total", "LLM admission decisions", ("result",))
+
+
+class AdmissionDenied(Exception):
+    """The LLM call was not admitted; `reason` is rate_limited, queue_full or timeout."""
+
+    def __init__(self, reason, retry_after=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ClientLimiter:
+    """Non-blocking token bucket per client key, LRU-bounded."""
+
+    def __init__(self, per_minute=CLIENT_RPM, burst=CLIENT_BURST, max_clients=MAX_CLIENTS,
+                 clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = float(max(1, burst))
+        self.max_clients = max_clients
+        self.clock = clock
+        self._buckets = OrderedDict()       # key -> [tokens, updated]
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key):
+        """0.0 when a token was taken, else the seconds until one is available."""
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.capacity, now]
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, max_queue=ADMISSION_QUEUE,
+                 max_wait=ADMISSION_WAIT, client_rpm=CLIENT_RPM, client_burst=CLIENT_BURST,
+                 overflow=OVERFLOW):
+        if overflow not in ("degrade", "reject"):
+            raise ValueError(f"unknown admission overflow mode: {overflow!r}")
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.overflow = overflow
+        self.clients = ClientLimiter(client_rpm, client_burst) if client_rpm > 0 else None
+        self.in_flight = 0
+        self.queued = 0
+        self._cond = threading.Condition()
+
+    def charge(self, client):
+        """Take one of `client`'s tokens without an LLM slot, or raise AdmissionDenied."""
+        if client is not None and self.clients is not None:
+            wait_s = self.clients.try_acquire(client)
+            if wait_s:
+                ADMISSIONS.inc(result="rate_limited")
+                raise AdmissionDenied("rate_limited", retry_after=wait_s)
+
+    def acquire(self, client=None):
+        """Charge `client`, then take an LLM slot (waiting in the bounded queue if needed)."""
+        self.charge(client)
+        with self._cond:
+            if self.in_flight >= self.max_in_flight:
+                if self.queued >= self.max_queue:
+                    ADMISSIONS.inc(result="queue_full")
+                    raise AdmissionDenied("queue_full", retry_after=1.0)
+                self.queued += 1
+                try:
+                    deadline = time.monotonic() + self.max_wait
+                    while self.in_flight >= self.max_in_flight:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            ADMISSIONS.inc(result="timeout")
+                            raise AdmissionDenied("timeout", retry_after=1.0)
+                        self._cond.wait(remaining)
+                finally:
+                    self.queued -= 1
+            self.in_flight += 1
+        ADMISSIONS.inc(result="admitted")
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def stats(self):
+        return {"in_flight": self.in_flight, "queued": self.queued,
+                "clients": len(self.clients) if self.clients is not None else 0}
+
+
+def make_admission():
+    """Controller configured from VMITRA_*; None when admission control is off."""
+    return AdmissionController() if MAX_IN_FLIGHT > 0 else None
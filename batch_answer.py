@@ -0,0 +1,256 @@
+"""
+Answer a JSONL file of questions offline (complaint-desk exports, QA sets,
+regression checks after KB edits) through the same ChatEngine as the UI.
+
+Input: one JSON object per line with an `id` and the question under
+`question`, `message`, `query` or `text` (or `--field`). Rows without an id
+are numbered by line.
+
+    python batch_answer.py questions.jsonl answers.jsonl --workers 8 --rps 5
+
+Rows are read in chunks; each chunk is embedded in one forward pass, then the
+turns fan out over a bounded worker pool. Groq calls are held to `--rps`
+(KB-direct and cached answers are not limited). Each answer is appended to
+the output as soon as it is ready, so an interrupted run loses nothing. Re-run
+the same command to resume: ids already in the output are skipped.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+log = logging.getLogger("vmitra.batch")
+
+TEXT_FIELDS = ("question", "message", "query", "text")
+CHUNK_SIZE  = 64
+
+
+class RateLimiter:
+    """Blocking token bucket: at most `rate` acquisitions per second, `burst` at once."""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_s = (1 - self.tokens) / self.rate
+            self.sleep(wait_s)
+
+
+class RateLimitedGroq:
+    """GroqClient proxy that takes a limiter token before every upstream call."""
+
+    def __init__(self, client, limiter):
+        self._client = client
+        self._limiter = limiter
+
+    def completion(self, payload):
+        self._limiter.acquire()
+        return self._client.completion(payload)
+
+    def complete(self, payload):
+        return self.completion(payload).text
+
+    def stream(self, payload):
+        self._limiter.acquire()
+        return self._client.stream(payload)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+# ────────────────────────────────
+# Input / output
+# ────────────────────────────────
+def iter_rows(path, field=None):
+    """(id, text, row) per usable input line; blank and malformed lines are logged and skipped."""
+    fields = (field,) if field else TEXT_FIELDS
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                log.warning("line %d: not JSON, skipped", lineno)
+                continue
+            text = next((row[k] for k in fields
+                         if isinstance(row, dict) and isinstance(row.get(k), str)), None)
+            if not text or not text.strip():
+                log.warning("line %d: no question field (%s), skipped", lineno, "/".join(fields))
+                continue
+            yield str(row.get("id", lineno)), text.strip(), row
+
+
+def load_done(path, retry_fallback=False):
+    """
+    Ids already answered in an existing output file. A line cut short by an
+    interrupted run is dropped from the file so appending stays valid JSONL.
+    Rows that errored – and with `retry_fallback`, KB-only fallbacks – are
+    not counted as done.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+    for line in data.decode("utf-8").splitlines():
+        try:
+            row = json.loads(line)
+        except ValueError:
+            continue
+        if row.get("error") or (retry_fallback and row.get("source") == "kb_fallback"):
+            continue
+        done.add(str(row.get("id")))
+    return done
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _result(row_id, retrieval, turn, started):
+    return {"id": row_id, "question": retrieval.text, "reply": turn.reply,
+            "source": turn.source, "lang": retrieval.lang, "passages": retrieval.ctx_ids,
+            "prompt_tokens": turn.prompt_tokens, "usage": turn.usage,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+# ────────────────────────────────
+# Runner
+# ────────────────────────────────
+def run_batch(engine, in_path, out_path, workers=8, chunk_size=CHUNK_SIZE, field=None,
+              retry_fallback=False, progress_every=100):
+    """Answer every not-yet-done row of `in_path` into `out_path`; returns counters."""
+    done = load_done(out_path, retry_fallback)
+    counts = {"skipped": 0, "answered": 0, "errors": 0}
+    sources = {}
+    write_lock = threading.Lock()
+    t_start = time.perf_counter()
+
+    def pending():
+        seen = set()
+        for row_id, text, _ in iter_rows(in_path, field):
+            if row_id in done or row_id in seen:
+                counts["skipped"] += 1
+                continue
+            seen.add(row_id)
+            yield row_id, text
+
+    with open(out_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(workers, thread_name_prefix="batch") as pool:
+
+        def write(obj):
+            with write_lock:
+                out.write(json.dumps(obj, ensure_ascii=False) + "\n")
+                out.flush()
+
+        def answer(row_id, retrieval):
+            started = time.perf_counter()
+            try:
+                turn = engine.generate(retrieval)
+            except Exception as e:
+                log.exception("row %s failed", row_id)
+                write({"id": row_id, "question": retrieval.text, "error": repr(e)})
+                return None
+            write(_result(row_id, retrieval, turn, started))
+            return turn.source
+
+        in_flight = set()
+        next_report = progress_every
+        for chunk in _chunks(pending(), chunk_size):
+            retrievals = engine.retrieve_many([text for _, text in chunk])
+            for (row_id, _), r in zip(chunk, retrievals):
+                # bounded backlog: at most 4 turns per worker queued or running
+                while len(in_flight) >= workers * 4:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    _tally(finished, counts, sources)
+                in_flight.add(pool.submit(answer, row_id, r))
+            total = counts["answered"] + counts["errors"]
+            if progress_every and total >= next_report:
+                log.info("%d answered, %d errors, %d skipped (%.1f rows/s)",
+                         counts["answered"], counts["errors"], counts["skipped"],
+                         total / (time.perf_counter() - t_start))
+                next_report = total + progress_every
+        _tally(wait(in_flight).done, counts, sources)
+
+    counts["sources"] = sources
+    counts["seconds"] = time.perf_counter() - t_start
+    return counts
+
+
+def _tally(futures, counts, sources):
+    for fut in futures:
+        source = fut.result()
+        if source is None:
+            counts["errors"] += 1
+        else:
+            counts["answered"] += 1
+            sources[source] = sources.get(source, 0) + 1
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Answer a JSONL file of questions")
+    ap.add_argument("input")
+    ap.add_argument("output")
+    ap.add_argument("--workers", type=int, default=8, help="concurrent turns")
+    ap.add_argument("--rps", type=float, default=5.0,
+                    help="max Groq requests per second (0 = unlimited)")
+    ap.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="rows embedded per batch")
+    ap.add_argument("--field", help="JSON key holding the question")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="bypass the semantic cache (e.g. re-answering after KB edits)")
+    ap.add_argument("--retry-fallback", action="store_true",
+                    help="re-answer rows that previously got a KB-only fallback")
+    args = ap.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise SystemExit("❌ Please set the GROQ_API_KEY in your .env")
+
+    from engine import build_engine
+    engine = build_engine(api_key)
+    if args.no_cache:
+        engine.cache = None
+    if args.rps > 0:
+        engine.groq = RateLimitedGroq(engine.groq, RateLimiter(args.rps))
+
+    counts = run_batch(engine, args.input, args.output, args.workers, args.chunk,
+                       args.field, args.retry_fallback)
+    print(json.dumps(counts, indent=2))
+    return 1 if counts["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Cross-request micro-batching in front of the sentence embedder.
+
+Concurrent callers (Streamlit sessions, API requests) each want one query
+vector. Instead of N forward passes of batch size 1, a single worker thread
+collects requests for up to `window_ms` (or until `max_batch` are waiting),
+encodes them in one call and hands each caller its own row.
+
+EmbeddingBatcher exposes the same `encode(texts)` as the model, so it drops in
+wherever an embedder is expected.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import REGISTRY
+
+BATCH_WINDOW_MS = float(os.getenv("VMITRA_BATCH_WINDOW_MS", "3"))
+BATCH_MAX       = int(os.getenv("VMITRA_BATCH_MAX", "32"))
+
+_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, float("inf"))
+
+BATCH_SIZE = REGISTRY.histogram("vmitra_embed_batch_size", "Queries per embedding forward pass",
+                                buckets=_SIZE_BUCKETS[:-1])
+
+
+class EmbeddingBatcher:
+    def __init__(self, model, window_ms=BATCH_WINDOW_MS, max_batch=BATCH_MAX):
+        self.model = model
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        # metrics
+        self.batches = 0
+        self.items = 0
+        self.max_seen = 0
+        self.size_hist = {b: 0 for b in _SIZE_BUCKETS}   # batch size <= bucket
+        self.encode_seconds = 0.0
+        self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._worker.start()
+
+    # ── public API ──
+    def submit(self, text):
+        """Queue one text; the Future resolves to its (unnormalized) vector."""
+        fut = Future()
+        if self._closed:
+            fut.set_exception(RuntimeError("batcher is closed"))
+            return fut
+        self._queue.put((text, fut))
+        return fut
+
+    def encode(self, texts, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        # bulk jobs (index builds) are already batched – go straight to the model
+        if len(texts) > self.max_batch:
+            return self.model.encode(texts, **kwargs)
+        futures = [self.submit(t) for t in texts]
+        return np.stack([f.result() for f in futures])
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            return {"queue_depth": self.queue_depth,
+                    "batches": self.batches,
+                    "items": self.items,
+                    "avg_batch": self.items / self.batches if self.batches else 0.0,
+                    "max_batch": self.max_seen,
+                    "batch_size_hist": dict(self.size_hist),
+                    "encode_seconds": self.encode_seconds}
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join(timeout=5)
+
+    # ── worker ──
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:            # close() sentinel: finish this batch first
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            texts = [t for t, _ in batch]
+            t0 = time.perf_counter()
+            try:
+                vecs = np.asarray(self.model.encode(texts, batch_size=len(texts),
+                                                    convert_to_numpy=True))
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - t0
+            for (_, fut), vec in zip(batch, vecs):
+                fut.set_result(vec)
+            with self._lock:
+                n = len(batch)
+                self.batches += 1
+                self.items += n
+                self.max_seen = max(self.max_seen, n)
+                self.encode_seconds += elapsed
+                for b in _SIZE_BUCKETS:
+                    if n <= b:
+                        self.size_hist[b] += 1
+                        break
+            BATCH_SIZE.observe(n)
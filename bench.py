@@ -0,0 +1,374 @@
+"""
+Offline benchmark: replays bench/corpus.jsonl (KB intent questions plus
+English / Hindi / Hinglish paraphrases) through ChatEngine – the same
+retrieve → generate path groq.py uses – against mock_groq.py instead of Groq.
+
+Reported per run:
+    - end-to-end latency and per-stage percentiles (p50 / p95 / p99)
+    - queries/sec at each concurrency level
+    - which path served the turns (kb_direct / cache / llm / …)
+    - peak RSS, and cold start (fresh process → first answered turn)
+
+    python bench.py run                              # default levels 1,4,16
+    python bench.py run --concurrency 1,8,32 --stream --queries 300
+    python bench.py run --save-baseline main         # bench/baselines/main.json
+    python bench.py run --compare main               # exit 1 on regression
+    python bench.py coldstart
+    python bench.py render --history 0,20,100,200    # UI: CPU + bytes per turn
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from mock_groq import start_mock
+
+CORPUS_PATH  = os.path.join("bench", "corpus.jsonl")
+BASELINE_DIR = os.path.join("bench", "baselines")
+STAGES       = ("embed", "search", "prompt", "groq_ttfb", "groq_total")
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentiles(seconds):
+    if not seconds:
+        return {}
+    ms = np.asarray(seconds) * 1000.0
+    return {"p50": float(np.percentile(ms, 50)), "p95": float(np.percentile(ms, 95)),
+            "p99": float(np.percentile(ms, 99)), "mean": float(ms.mean()), "n": len(ms)}
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+# ────────────────────────────────
+# Load test
+# ────────────────────────────────
+def run_level(engine, queries, concurrency, stream=False):
+    on_delta = (lambda _: None) if stream else None
+
+    def one(q):
+        t0 = time.perf_counter()
+        try:
+            turn = engine.respond(q, on_delta=on_delta)
+        except Exception as e:          # a crash is a result too
+            return time.perf_counter() - t0, None, repr(e)
+        return time.perf_counter() - t0, turn, None
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, queries))
+    wall = time.perf_counter() - t0
+
+    stage_samples = {s: [] for s in STAGES}
+    sources, errors = Counter(), []
+    for _, turn, err in results:
+        if err:
+            errors.append(err)
+            continue
+        sources[turn.source] += 1
+        for s in STAGES:
+            if s in turn.retrieval.timings:
+                stage_samples[s].append(turn.retrieval.timings[s])
+    return {"concurrency": concurrency, "queries": len(queries),
+            "wall_seconds": wall, "qps": len(queries) / wall if wall else 0.0,
+            "latency_ms": percentiles([d for d, _, _ in results]),
+            "stages_ms": {s: percentiles(v) for s, v in stage_samples.items() if v},
+            "sources": dict(sources), "errors": len(errors),
+            "error_samples": errors[:3]}
+
+
+def run_bench(engine, corpus, levels=(1, 4, 16), n_queries=None, stream=False, warmup=5):
+    texts = [row["query"] for row in corpus]
+    n = n_queries or len(texts)
+    queries = [texts[i % len(texts)] for i in range(n)]
+    for q in texts[:warmup]:
+        engine.respond(q)
+    return [run_level(engine, queries, c, stream) for c in levels]
+
+
+# ────────────────────────────────
+# Cold start (fresh interpreter)
+# ────────────────────────────────
+def _cold_child(url, backend):
+    t0 = time.perf_counter()
+    from engine import build_engine
+    t1 = time.perf_counter()
+    engine = build_engine("bench", url, **({"backend": backend} if backend else {}))
+    t2 = time.perf_counter()
+    engine.respond("How do I register?")
+    t3 = time.perf_counter()
+    print(json.dumps({"import_s": t1 - t0, "build_s": t2 - t1, "first_turn_s": t3 - t2,
+                      "peak_rss_mb": peak_rss_mb()}))
+
+
+def cold_start(url, backend=None):
+    cmd = [sys.executable, os.path.abspath(__file__), "_cold", "--groq-url", url]
+    if backend:
+        cmd += ["--backend", backend]
+    t0 = time.perf_counter()
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    total = time.perf_counter() - t0
+    report = json.loads(out.stdout.strip().splitlines()[-1])
+    report["total_s"] = total
+    return report
+
+
+# ────────────────────────────────
+# UI render cost (Streamlit)
+# ────────────────────────────────
+def _capture_forward_msgs():
+    """Record (hash, size, ref size, cacheable) of every ForwardMsg the app emits."""
+    from streamlit.runtime import forward_msg_cache
+    from streamlit.runtime.scriptrunner_utils import script_run_context as src
+
+    sent = []
+
+    def populate(msg):
+        forward_msg_cache.populate_hash_if_needed(msg)
+        cacheable = msg.metadata.cacheable
+        ref = forward_msg_cache.create_reference_msg(msg).ByteSize() if cacheable else 0
+        sent.append((msg.hash, msg.ByteSize(), ref, cacheable))
+    src.populate_hash_if_needed = populate
+    return sent
+
+
+def _wire_bytes(msgs, browser_cache):
+    """Bytes on the websocket, given the hashes the browser already holds."""
+    total = 0
+    for h, size, ref, cacheable in msgs:
+        total += ref if cacheable and h in browser_cache else size
+        if cacheable:
+            browser_cache.add(h)
+    return total
+
+
+def render_cost(app_path, history_lengths, turns=3, url=None):
+    """
+    Per history length: server CPU and bytes sent to the browser for a page
+    load and for each chat turn, with the browser's ForwardMsg cache modelled.
+    The conversation is pre-filled in both the conversation store and
+    st.session_state.history, so older versions of the app can be compared.
+    """
+    from streamlit import config as st_config
+    from streamlit.testing.v1 import AppTest
+    from conversations import ConversationStore
+
+    st_config.set_option("global.minCachedMessageSize", 2000)
+    sent = _capture_forward_msgs()
+    corpus = [row["query"] for row in load_corpus()]
+    store = ConversationStore()
+    report = []
+    for n in history_lengths:
+        token = f"bench-render-{n}-{time.time_ns()}"
+        history = []
+        for i in range(n):
+            role = "user" if i % 2 == 0 else "bot"
+            text = corpus[i % len(corpus)] if role == "user" else \
+                "First, open the app. Then tap the button and follow the steps. " * 4
+            store.append(token, role, text)
+            history.append((role, text))
+
+        at = AppTest.from_file(app_path, default_timeout=120)
+        at.secrets["GROQ_API_KEY"] = "bench"
+        at.session_state["conv"] = token
+        at.session_state["history"] = [("bot", "👋 Hello!")] + history
+        browser = set()
+        del sent[:]
+        c0 = time.process_time()
+        at.run()
+        load = {"cpu_ms": (time.process_time() - c0) * 1000, "bytes": _wire_bytes(sent, browser)}
+        per_turn = []
+        for t in range(turns):
+            del sent[:]
+            c0 = time.process_time()
+            at.chat_input[0].set_value(corpus[(n + t) % len(corpus)]).run()
+            per_turn.append({"cpu_ms": (time.process_time() - c0) * 1000,
+                             "bytes": _wire_bytes(sent, browser)})
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+        report.append({"history": n, "load": load,
+                       "turn_cpu_ms": float(np.median([t["cpu_ms"] for t in per_turn])),
+                       "turn_bytes": int(np.median([t["bytes"] for t in per_turn]))})
+    return report
+
+
+# ────────────────────────────────
+# Baselines
+# ────────────────────────────────
+def _headline(result):
+    """Flat {metric: value} used for baseline comparison; lower is better except qps."""
+    flat = {}
+    for level in result["levels"]:
+        c = level["concurrency"]
+        flat[f"c{c}.qps"] = level["qps"]
+        for p in ("p50", "p95", "p99"):
+            flat[f"c{c}.latency_{p}_ms"] = level["latency_ms"].get(p)
+        for s, st in level["stages_ms"].items():
+            flat[f"c{c}.{s}_p95_ms"] = st.get("p95")
+    flat["peak_rss_mb"] = result.get("peak_rss_mb")
+    if result.get("cold_start"):
+        flat["cold_start_s"] = result["cold_start"]["total_s"]
+    return {k: v for k, v in flat.items() if v is not None}
+
+
+def compare(current, baseline, tolerance=0.15, min_delta_ms=2.0):
+    """
+    Rows of (metric, baseline, current, change, regressed). Millisecond metrics
+    must also slow down by `min_delta_ms` to count, so jitter on sub-millisecond
+    stages is not reported as a regression.
+    """
+    now, base = _headline(current), _headline(baseline)
+    rows = []
+    for k in sorted(set(now) & set(base)):
+        b, c = base[k], now[k]
+        change = (c - b) / b if b else 0.0
+        worse = -change if k.endswith(".qps") else change
+        regressed = worse > tolerance and not (k.endswith("_ms") and c - b < min_delta_ms)
+        rows.append((k, b, c, change, regressed))
+    return rows
+
+
+def _baseline_path(name):
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def _print_levels(result):
+    for level in result["levels"]:
+        lat = level["latency_ms"]
+        print(f"\nconcurrency {level['concurrency']:>3}: {level['qps']:8.1f} q/s   "
+              f"p50 {lat['p50']:8.1f}  p95 {lat['p95']:8.1f}  p99 {lat['p99']:8.1f} ms   "
+              f"errors {level['errors']}   {level['sources']}")
+        for s, st in level["stages_ms"].items():
+            print(f"    {s:>11}: p50 {st['p50']:8.2f}  p95 {st['p95']:8.2f}  "
+                  f"p99 {st['p99']:8.2f} ms  (n={st['n']})")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="V-Mitra offline benchmark")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--groq-url", help="use this endpoint instead of a local mock")
+    common.add_argument("--backend", help="embedding backend (st | onnx | onnx-int8)")
+    common.add_argument("--ttfb-ms", type=float, default=250.0, help="mock time to first byte")
+    common.add_argument("--token-ms", type=float, default=10.0, help="mock per-token delay")
+    common.add_argument("--tokens", type=int, default=60, help="mock reply length")
+
+    run = sub.add_parser("run", parents=[common], help="load test at several concurrency levels")
+    run.add_argument("--corpus", default=CORPUS_PATH)
+    run.add_argument("--concurrency", default="1,4,16")
+    run.add_argument("--queries", type=int, help="queries per level (default: corpus size)")
+    run.add_argument("--stream", action="store_true", help="use the streaming path")
+    run.add_argument("--cache", action="store_true",
+                     help="keep the semantic cache on (off by default: repeats would all hit)")
+    run.add_argument("--no-coldstart", action="store_true")
+    run.add_argument("--out", help="write the full result JSON here")
+    run.add_argument("--save-baseline", metavar="NAME")
+    run.add_argument("--compare", metavar="NAME")
+    run.add_argument("--tolerance", type=float, default=0.15,
+                     help="relative slowdown that counts as a regression")
+
+    sub.add_parser("coldstart", parents=[common], help="fresh process → first answer")
+    sub.add_parser("_cold", parents=[common])      # child process of `coldstart`
+
+    render = sub.add_parser("render", parents=[common],
+                            help="Streamlit UI: server CPU and bytes per turn vs. history length")
+    render.add_argument("--app", default="groq.py",
+                        help="app script (e.g. an older groq.py saved from git, to compare)")
+    render.add_argument("--history", default="0,20,100,200",
+                        help="conversation lengths (messages) to measure")
+    render.add_argument("--turns", type=int, default=3, help="turns measured per length")
+    args = ap.parse_args(argv)
+
+    mock_url = args.groq_url
+    if mock_url is None:
+        _, mock_url, _ = start_mock(ttfb_ms=args.ttfb_ms, token_ms=args.token_ms,
+                                    tokens=args.tokens)
+    backend_kw = {"backend": args.backend} if args.backend else {}
+
+    if args.command == "_cold":
+        _cold_child(mock_url, args.backend)
+        return 0
+    if args.command == "coldstart":
+        print(json.dumps(cold_start(mock_url, args.backend), indent=2))
+        return 0
+
+    if args.command == "render":
+        lengths = [int(n) for n in args.history.split(",") if n.strip()]
+        # the app builds its own engine: point it at the mock, show whole conversations
+        os.environ["GROQ_API_URL"] = mock_url
+        os.environ.setdefault("VMITRA_CHAT_WINDOW", str(max(lengths) + 2 * args.turns))
+        os.environ.setdefault("VMITRA_CONV_PATH",
+                              os.path.join(tempfile.mkdtemp(), "conversations.sqlite3"))
+        if args.backend:
+            os.environ["VMITRA_EMBED_BACKEND"] = args.backend
+        report = render_cost(args.app, lengths, args.turns)
+        print(f"{'history':>8} {'load ms':>9} {'load KiB':>9} {'turn ms':>9} {'turn KiB':>9}")
+        for r in report:
+            print(f"{r['history']:>8} {r['load']['cpu_ms']:>9.1f} {r['load']['bytes'] / 1024:>9.1f}"
+                  f" {r['turn_cpu_ms']:>9.1f} {r['turn_bytes'] / 1024:>9.1f}")
+        return 0
+
+    from engine import build_engine
+    engine = build_engine("bench", mock_url, **backend_kw)
+    if not args.cache:
+        engine.cache = None
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    corpus = load_corpus(args.corpus)
+    result = {"started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "config": {"stream": args.stream, "cache": args.cache,
+                         "backend": args.backend or os.getenv("VMITRA_EMBED_BACKEND", "st"),
+                         "retriever": os.getenv("VMITRA_RETRIEVER", "hybrid"),
+                         "mock": None if args.groq_url else
+                         {"ttfb_ms": args.ttfb_ms, "token_ms": args.token_ms,
+                          "tokens": args.tokens},
+                         "corpus": len(corpus)},
+              "levels": run_bench(engine, corpus, levels, args.queries, args.stream)}
+    result["peak_rss_mb"] = peak_rss_mb()
+    if not args.no_coldstart:
+        result["cold_start"] = cold_start(mock_url, args.backend)
+
+    _print_levels(result)
+    print(f"\npeak RSS {result['peak_rss_mb']:.0f} MiB")
+    if result.get("cold_start"):
+        cs = result["cold_start"]
+        print(f"cold start {cs['total_s']:.2f}s (imports {cs['import_s']:.2f}s, "
+              f"build {cs['build_s']:.2f}s, first turn {cs['first_turn_s']:.2f}s)")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(_baseline_path(args.save_baseline), "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"baseline saved to {_baseline_path(args.save_baseline)}")
+    if args.compare:
+        with open(_baseline_path(args.compare), "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(result, baseline, args.tolerance)
+        print(f"\n{'metric':<28} {'baseline':>10} {'now':>10} {'change':>8}")
+        for k, b, c, change, bad in rows:
+            print(f"{k:<28} {b:>10.2f} {c:>10.2f} {change:>+7.0%}{'  ← regression' if bad else ''}")
+        if any(bad for *_, bad in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
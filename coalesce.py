@@ -0,0 +1,132 @@
+"""
+Single-flight coalescing of identical concurrent LLM turns.
+
+When many people ask the same thing at once (outages, announcements), turns
+with the same normalized question, retrieved passages, language and KB
+generation share one upstream call. Like the semantic cache, the key does not
+include the conversation history, so ChatEngine only coalesces turns that
+have none – a reply shaped by one user's earlier messages is never handed to
+another user.
+
+The call runs on its own thread and always streams; every request for it –
+the one that started it included – is a subscriber. Streaming subscribers get every delta,
+including those sent before they joined, and blocking subscribers get the
+final reply. The result or the error is fanned out to all of them. A
+subscriber that goes away (its on_delta raises) only detaches itself; the
+upstream stream is abandoned once nobody is listening any more.
+"""
+import os
+import re
+import threading
+
+from metrics import REGISTRY
+
+COALESCE = os.getenv("VMITRA_COALESCE", "1") != "0"
+
+COALESCED = REGISTRY.counter("vmitra_coalesced_turns_total",
+                             "Turns served by another request's in-flight LLM call")
+
+_TRAILING = re.compile(r"[\s?!.।॥,;:]+$")
+
+
+def normalize(text):
+    return _TRAILING.sub("", " ".join(text.casefold().split()))
+
+
+def flight_key(r):
+    return (normalize(r.text), tuple(r.ctx_ids), r.lang, r.kb_generation)
+
+
+class Abandoned(Exception):
+    """Every subscriber of a flight went away."""
+
+
+class Flight:
+    def __init__(self, key):
+        self.key = key
+        self.deltas = []
+        self.subscribers = 1
+        self.abandoned = False
+        self.done = False
+        self.result = None
+        self.error = None
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        """(flight, True) for a new flight the caller must start, else (flight, False)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.subscribers += 1
+                return flight, False
+            flight = self._flights[key] = Flight(key)
+            return flight, True
+
+    def start(self, flight, fn):
+        """Run fn(publish) on a new thread; its return value or exception goes to every subscriber."""
+        def publish(delta):
+            with flight.cond:
+                if flight.abandoned:
+                    raise Abandoned()
+                flight.deltas.append(delta)
+                flight.cond.notify_all()
+
+        def run():
+            try:
+                result, error = fn(publish), None
+            except BaseException as e:
+                result, error = None, e
+            with self._lock:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+            with flight.cond:
+                flight.result, flight.error, flight.done = result, error, True
+                flight.cond.notify_all()
+
+        threading.Thread(target=run, name="llm-flight", daemon=True).start()
+
+    def follow(self, flight, on_delta=None):
+        """Wait for the flight's result, relaying deltas to on_delta; re-raises its error."""
+        sent = 0
+        try:
+            while True:
+                with flight.cond:
+                    while not flight.done and (on_delta is None or sent == len(flight.deltas)):
+                        flight.cond.wait()
+                    pending, done = flight.deltas[sent:], flight.done
+                    sent = len(flight.deltas)
+                if on_delta is not None:
+                    for delta in pending:
+                        on_delta(delta)
+                if done:
+                    break
+        except BaseException:
+            self._leave(flight)
+            raise
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def _leave(self, flight):
+        with self._lock:
+            flight.subscribers -= 1
+            if flight.subscribers > 0:
+                return
+            # nobody left: no new joiners, and the next delta stops the upstream
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        with flight.cond:
+            flight.abandoned = True
+
+    def __len__(self):
+        return len(self._flights)
+
+
+def make_flights():
+    return SingleFlight() if COALESCE else None
@@ -0,0 +1,154 @@
+"""
+Persistent, bounded conversation store for the chat UI.
+
+One local SQLite file (WAL, shared by every Streamlit worker on the node)
+replaces the unbounded per-browser `st.session_state.history` list, so
+server memory stays flat however long people chat and conversations
+survive a restart or redeploy.
+
+Layout is kept compact: the browser's session token is stored once and
+messages refer to it by integer id; messages live in a WITHOUT ROWID table
+clustered on (session, seq) so a window of recent turns is one range scan;
+timestamps are integer seconds and long texts are zlib-compressed.
+
+Bounds:
+    CONV_TTL        sessions idle longer than this are deleted with their messages
+    CONV_MAX        per-session cap; the oldest messages are dropped beyond it
+"""
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+CONV_PATH    = os.getenv("VMITRA_CONV_PATH", ".vmitra_conversations.sqlite3")
+CONV_TTL     = float(os.getenv("VMITRA_CONV_TTL", str(30 * 24 * 3600)))
+CONV_MAX     = int(os.getenv("VMITRA_CONV_MAX", "200"))        # messages per session
+COMPRESS_MIN = 256          # bytes; shorter texts are stored as-is
+EVICT_EVERY  = 300.0        # seconds between TTL sweeps
+
+_ROLES = ("user", "bot")
+_ZLIB  = 2                  # flag bit in the `kind` column
+
+
+def _pack(role, text):
+    raw = text.encode("utf-8")
+    kind = _ROLES.index(role)
+    if len(raw) >= COMPRESS_MIN:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return kind | _ZLIB, packed
+    return kind, raw
+
+
+def _unpack(kind, blob):
+    raw = zlib.decompress(blob) if kind & _ZLIB else blob
+    return _ROLES[kind & 1], raw.decode("utf-8")
+
+
+class ConversationStore:
+    def __init__(self, path=CONV_PATH, ttl=CONV_TTL, max_messages=CONV_MAX):
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._last_evict = 0.0
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id          INTEGER PRIMARY KEY,
+                token       TEXT NOT NULL UNIQUE,
+                last_active INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_active ON sessions(last_active);
+            CREATE TABLE IF NOT EXISTS messages (
+                session INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+                seq     INTEGER NOT NULL,
+                kind    INTEGER NOT NULL,           -- 0 user / 1 bot, | 2 if zlib
+                created INTEGER NOT NULL,
+                body    BLOB NOT NULL,
+                PRIMARY KEY (session, seq)
+            ) WITHOUT ROWID;
+        """)
+
+    def _session_id(self, token, create=False):
+        # not cached: another worker may have evicted the session meanwhile
+        row = self._db.execute("SELECT id FROM sessions WHERE token=?", (token,)).fetchone()
+        if row is None and create:
+            return self._db.execute("INSERT INTO sessions(token, last_active) VALUES (?,?)",
+                                    (token, int(time.time()))).lastrowid
+        return row[0] if row else None
+
+    def append(self, token, role, text):
+        """Add one message; returns its sequence number within the session."""
+        now = time.time()
+        kind, body = _pack(role, text)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                sid = self._session_id(token, create=True)
+                last = self._db.execute("SELECT MAX(seq) FROM messages WHERE session=?",
+                                        (sid,)).fetchone()[0]
+                seq = 0 if last is None else last + 1
+                self._db.execute("INSERT INTO messages VALUES (?,?,?,?,?)",
+                                 (sid, seq, kind, int(now), body))
+                self._db.execute("UPDATE sessions SET last_active=? WHERE id=?",
+                                 (int(now), sid))
+                if self.max_messages:
+                    self._db.execute("DELETE FROM messages WHERE session=? AND seq<=?",
+                                     (sid, seq - self.max_messages))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            if now - self._last_evict >= EVICT_EVERY:
+                self._evict(now)
+            return seq
+
+    def page(self, token, limit, before=None):
+        """
+        Up to `limit` messages as [(seq, role, text)] oldest first – the most
+        recent ones, or those older than `before` when paging back.
+        """
+        with self._lock:
+            sid = self._session_id(token)
+            if sid is None:
+                return []
+            rows = self._db.execute(
+                "SELECT seq, kind, body FROM messages WHERE session=? AND seq<?"
+                " ORDER BY seq DESC LIMIT ?",
+                (sid, before if before is not None else 1 << 62, limit)).fetchall()
+        return [(seq, *_unpack(kind, body)) for seq, kind, body in reversed(rows)]
+
+    def history(self, token, limit):
+        """The last `limit` messages as [(role, text)], the shape ChatEngine takes."""
+        return [(role, text) for _, role, text in self.page(token, limit)]
+
+    def count(self, token):
+        with self._lock:
+            sid = self._session_id(token)
+            if sid is None:
+                return 0
+            return self._db.execute("SELECT COUNT(*) FROM messages WHERE session=?",
+                                    (sid,)).fetchone()[0]
+
+    def delete(self, token):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE token=?", (token,))
+
+    def evict(self):
+        """Delete sessions idle for longer than the TTL; returns how many went."""
+        with self._lock:
+            return self._evict(time.time())
+
+    def _evict(self, now):
+        self._last_evict = now
+        return self._db.execute("DELETE FROM sessions WHERE last_active<?",
+                                (int(now - self.ttl),)).rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
@@ -0,0 +1,208 @@
+"""
+One embedding model per node, shared by every UI / API worker over a Unix socket.
+
+Without it each Streamlit process loads its own SentenceTransformer (and
+torch). With it, one `embed_server.py` process owns the model, builds the
+passage index artifact once, and answers encode requests; workers started
+with VMITRA_EMBED_BACKEND=remote only mmap the artifact (shared page cache)
+and send query texts here, so they stay small and start fast.
+
+    python embed_server.py --backend onnx          # or st / onnx-int8
+    VMITRA_EMBED_BACKEND=remote streamlit run groq.py
+
+Wire format, both directions: 4-byte big-endian length + payload.
+    request   {"op": "encode", "texts": [...]}  |  {"op": "info"}
+    response  {"ok": true, "shape": [n, dim]} then one frame of float32 bytes
+              {"ok": true, "model_id": ..., "dim": ...}
+              {"ok": false, "error": "..."}
+Requests from all workers go through one EmbeddingBatcher, so concurrent
+queries across processes still share forward passes.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+import numpy as np
+
+from batcher import BATCH_MAX, BATCH_WINDOW_MS, EmbeddingBatcher
+from kb_index import EMBED_MODEL, KB_PATH, load_or_build_index
+
+log = logging.getLogger("vmitra.embed_server")
+
+EMBED_SOCKET = os.getenv("VMITRA_EMBED_SOCKET", "/tmp/vmitra-embed.sock")
+MAX_FRAME    = 64 * 1024 * 1024
+_LEN         = struct.Struct(">I")
+
+
+class EmbedServerError(RuntimeError):
+    """The embedding server refused or failed a request."""
+
+
+def _send(sock, payload):
+    sock.sendall(_LEN.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("embedding server connection closed")
+        buf += chunk
+    return bytes(buf)
+
+
+def _recv(sock):
+    (n,) = _LEN.unpack(_recv_exact(sock, _LEN.size))
+    if n > MAX_FRAME:
+        raise ConnectionError(f"frame of {n} bytes exceeds limit")
+    return _recv_exact(sock, n)
+
+
+# ────────────────────────────────
+# Client (VMITRA_EMBED_BACKEND=remote)
+# ────────────────────────────────
+class RemoteEmbedder:
+    """`encode(texts)` proxied to the node's embedding server; one connection per thread."""
+
+    def __init__(self, path=EMBED_SOCKET, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        info = self._call({"op": "info"})
+        self.model_id = info["model_id"]
+        self.dim = info["dim"]
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        return sock
+
+    def _roundtrip(self, request):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = self._local.sock = self._connect()
+        _send(sock, json.dumps(request, ensure_ascii=False).encode("utf-8"))
+        header = json.loads(_recv(sock))
+        if not header.get("ok"):
+            raise EmbedServerError(header.get("error", "unknown error"))
+        if request["op"] != "encode":
+            return header
+        n, dim = header["shape"]
+        return np.frombuffer(_recv(sock), dtype=np.float32).reshape(n, dim)
+
+    def _call(self, request):
+        # one retry on a fresh connection covers a restarted server
+        for attempt in (0, 1):
+            try:
+                return self._roundtrip(request)
+            except (ConnectionError, socket.timeout, OSError):
+                sock = getattr(self._local, "sock", None)
+                if sock is not None:
+                    sock.close()
+                self._local.sock = None
+                if attempt:
+                    raise
+
+    def encode(self, texts, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return self._call({"op": "encode", "texts": list(texts)})
+
+
+# ────────────────────────────────
+# Server
+# ────────────────────────────────
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock, embedder = self.request, self.server.embedder
+        while True:
+            try:
+                request = json.loads(_recv(sock))
+            except (ConnectionError, OSError):
+                return
+            except ValueError:
+                _send(sock, b'{"ok": false, "error": "request is not JSON"}')
+                return
+            try:
+                if request.get("op") == "info":
+                    _send(sock, json.dumps({"ok": True, "model_id": self.server.model_id,
+                                            "dim": self.server.dim}).encode())
+                elif request.get("op") == "encode":
+                    vecs = np.ascontiguousarray(embedder.encode(request["texts"]),
+                                                dtype=np.float32)
+                    _send(sock, json.dumps({"ok": True, "shape": list(vecs.shape)}).encode())
+                    _send(sock, vecs.tobytes())
+                else:
+                    _send(sock, b'{"ok": false, "error": "unknown op"}')
+            except (ConnectionError, OSError):
+                return
+            except Exception as e:
+                log.exception("encode failed")
+                _send(sock, json.dumps({"ok": False, "error": repr(e)}).encode())
+
+
+class EmbedServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, embedder, model_id):
+        if os.path.exists(path):
+            _remove_stale_socket(path)
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o660)
+        self.embedder = embedder
+        self.model_id = model_id
+        self.dim = int(np.asarray(embedder.encode(["warm up"])).shape[1])
+
+
+def _remove_stale_socket(path):
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)         # nobody listening: left over from a crash
+    else:
+        raise SystemExit(f"another embedding server is already listening on {path}")
+    finally:
+        probe.close()
+
+
+def main(argv=None):
+    from embedders import EMBED_BACKEND, embedder_id, load_embedder
+
+    ap = argparse.ArgumentParser(description="Shared embedding server (Unix socket)")
+    ap.add_argument("--socket", default=EMBED_SOCKET)
+    ap.add_argument("--backend", default=EMBED_BACKEND if EMBED_BACKEND != "remote" else "st",
+                    choices=["st", "onnx", "onnx-int8"])
+    ap.add_argument("--model", default=EMBED_MODEL)
+    ap.add_argument("--kb", default=KB_PATH)
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+
+    model = load_embedder(args.backend, args.model)
+    model_id = embedder_id(args.backend, args.model)
+    # build the artifact once here so workers only ever mmap it
+    index = load_or_build_index(lambda: model, args.kb, model_id)
+    embedder = (EmbeddingBatcher(model, BATCH_WINDOW_MS, BATCH_MAX)
+                if BATCH_WINDOW_MS > 0 and BATCH_MAX > 1 else model)
+    server = EmbedServer(args.socket, embedder, model_id)
+    log.info("serving %s (%d passages indexed) on %s", model_id, len(index), args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
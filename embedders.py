@@ -0,0 +1,198 @@
+"""
+Selectable query/passage embedding backends for all-MiniLM-L6-v2.
+
+    st         sentence-transformers (torch, fp32) – the reference
+    onnx       same model as an exported ONNX graph on onnxruntime (no torch)
+    onnx-int8  the ONNX graph with dynamically int8-quantized weights
+    remote     whichever of the above embed_server.py has loaded, over its
+               Unix socket (VMITRA_EMBED_SOCKET) – one model per node
+
+All backends expose `encode(texts) -> float32 [n, dim]` with normalized rows,
+so they are interchangeable wherever the SentenceTransformer was used.
+Heavy imports (torch, onnxruntime, tokenizers) happen inside the loaders.
+
+    python embedders.py export              # writes models/<model>-onnx/
+    python embedders.py parity --backend onnx-int8
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from kb_index import EMBED_MODEL, KB_PATH, iter_passages, load_kb
+
+EMBED_BACKEND = os.getenv("VMITRA_EMBED_BACKEND", "st")
+ONNX_DIR      = os.getenv("VMITRA_ONNX_DIR", f"models/{EMBED_MODEL}-onnx")
+ONNX_THREADS  = int(os.getenv("VMITRA_ONNX_THREADS", "0"))   # 0 = onnxruntime default
+MAX_SEQ_LEN   = 256
+BACKENDS      = ("st", "onnx", "onnx-int8", "remote")
+
+
+def _hf_id(model_name):
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+def embedder_id(backend=EMBED_BACKEND, model_name=EMBED_MODEL):
+    """
+    Identity used to key the on-disk passage index. fp32 ONNX reproduces the
+    torch vectors, so it shares the index; int8 gets its own so passages and
+    queries always come from the same encoder.
+    """
+    return f"{model_name}@int8" if backend == "onnx-int8" else model_name
+
+
+class OnnxEmbedder:
+    """Tokenizer (HF `tokenizers`) → ONNX transformer → mean pooling → L2 norm."""
+
+    def __init__(self, model_dir=ONNX_DIR, quantized=False, threads=ONNX_THREADS,
+                 max_length=MAX_SEQ_LEN):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        path = os.path.join(model_dir, "model_int8.onnx" if quantized else "model.onnx")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found – run `python embedders.py export`")
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        out = []
+        for start in range(0, len(texts), batch_size):
+            enc = self.tokenizer.encode_batch(list(texts[start:start + batch_size]))
+            ids  = np.array([e.ids for e in enc], dtype=np.int64)
+            mask = np.array([e.attention_mask for e in enc], dtype=np.int64)
+            feeds = {"input_ids": ids, "attention_mask": mask,
+                     "token_type_ids": np.zeros_like(ids)}
+            hidden = self.session.run(None, {k: v for k, v in feeds.items()
+                                             if k in self.input_names})[0]
+            m = mask[..., None].astype(np.float32)
+            pooled = (hidden * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1e-9)
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            out.append(pooled.astype(np.float32))
+        if not out:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(out)
+
+
+def load_embedder(backend=EMBED_BACKEND, model_name=EMBED_MODEL, onnx_dir=ONNX_DIR):
+    if backend == "st":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEmbedder(onnx_dir, quantized=(backend == "onnx-int8"))
+    if backend == "remote":
+        from embed_server import RemoteEmbedder
+        return RemoteEmbedder()
+    raise ValueError(f"unknown embedding backend {backend!r}; choose from {BACKENDS}")
+
+
+# ────────────────────────────────
+# Export (build time only: needs torch + transformers)
+# ────────────────────────────────
+def export_onnx(model_name=EMBED_MODEL, out_dir=ONNX_DIR, quantize=True, opset=17):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    tok = AutoTokenizer.from_pretrained(_hf_id(model_name))
+    tok.save_pretrained(out_dir)                  # writes tokenizer.json
+    model = AutoModel.from_pretrained(_hf_id(model_name)).eval()
+
+    sample = tok(["How do I add my bank account?"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    dyn = {n: {0: "batch", 1: "seq"} for n in names}
+    dyn["last_hidden_state"] = {0: "batch", 1: "seq"}
+    path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[n] for n in names), path,
+                          input_names=names, output_names=["last_hidden_state"],
+                          dynamic_axes=dyn, opset_version=opset)
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(path, os.path.join(out_dir, "model_int8.onnx"),
+                         weight_type=QuantType.QInt8)
+    return out_dir
+
+
+# ────────────────────────────────
+# Parity check against the reference vectors
+# ────────────────────────────────
+def _normalized(m):
+    m = np.asarray(m, dtype=np.float32)
+    return m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+
+
+def parity_report(reference, candidate, kb_path=KB_PATH, batch_size=64):
+    """
+    Encode every KB passage plus the intent questions with both embedders and
+    compare: per-text cosine between the two vectors, and whether the top-1
+    passage for each intent question is unchanged.
+    """
+    passages = iter_passages(load_kb(kb_path))
+    texts = [p.embed_text for p in passages]
+    queries = [p.text for p in passages if p.kind == "qa"]
+
+    timings = {}
+    vecs = {}
+    for name, emb in (("reference", reference), ("candidate", candidate)):
+        t0 = time.perf_counter()
+        vecs[name] = (_normalized(emb.encode(texts, batch_size=batch_size)),
+                      _normalized(emb.encode(queries, batch_size=batch_size)))
+        timings[name] = time.perf_counter() - t0
+
+    (ref_p, ref_q), (cand_p, cand_q) = vecs["reference"], vecs["candidate"]
+    cos = np.concatenate([(ref_p * cand_p).sum(axis=1), (ref_q * cand_q).sum(axis=1)])
+    top1_ref = np.argmax(ref_q @ ref_p.T, axis=1)
+    top1_cand = np.argmax(cand_q @ cand_p.T, axis=1)
+    return {"texts": len(cos),
+            "cosine_mean": float(cos.mean()), "cosine_min": float(cos.min()),
+            "cosine_p01": float(np.percentile(cos, 1)),
+            "top1_agreement": float((top1_ref == top1_cand).mean()),
+            "reference_seconds": timings["reference"],
+            "candidate_seconds": timings["candidate"]}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Embedding backends: export / parity check")
+    sub = ap.add_subparsers(dest="command", required=True)
+    ex = sub.add_parser("export", help="export the model to ONNX (+ int8)")
+    ex.add_argument("--model", default=EMBED_MODEL)
+    ex.add_argument("--out", default=ONNX_DIR)
+    ex.add_argument("--no-quantize", action="store_true")
+    pa = sub.add_parser("parity", help="compare a backend against sentence-transformers")
+    pa.add_argument("--backend", default="onnx-int8", choices=BACKENDS)
+    pa.add_argument("--onnx-dir", default=ONNX_DIR)
+    pa.add_argument("--min-cosine", type=float, default=0.98,
+                    help="fail if any text falls below this cosine")
+    pa.add_argument("--min-top1", type=float, default=1.0,
+                    help="fail if top-1 agreement on intent questions is lower")
+    args = ap.parse_args(argv)
+
+    if args.command == "export":
+        print("exported to", export_onnx(args.model, args.out, not args.no_quantize))
+        return 0
+
+    report = parity_report(load_embedder("st"), load_embedder(args.backend, onnx_dir=args.onnx_dir))
+    for k, v in report.items():
+        print(f"{k:>18}: {v:.4f}" if isinstance(v, float) else f"{k:>18}: {v}")
+    ok = report["cosine_min"] >= args.min_cosine and report["top1_agreement"] >= args.min_top1
+    print("PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,378 @@
+"""
+The chat pipeline, independent of any UI:
+
+    retrieve   embed the query + top-k KB passages        (CPU bound)
+    generate   curated / pre-generated KB answer → cache lookup → join an identical in-flight turn, or
+               admission → Groq (blocking or streamed) → KB-only fallback
+
+Streamlit (groq.py) and the HTTP service (server.py) are both thin clients of
+ChatEngine. One engine is shared by every conversation in a process, so it
+holds no per-user state.
+"""
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+
+import requests
+
+from admission import AdmissionDenied, make_admission
+from batcher import BATCH_MAX, BATCH_WINDOW_MS, EmbeddingBatcher
+from coalesce import COALESCED, Abandoned, flight_key, make_flights
+from embedders import EMBED_BACKEND, embedder_id, load_embedder
+from groq_client import (GROQ_API_URL, LLM_MODEL, GroqClient, GroqError,
+                         GroqStreamError, GroqUnavailable)
+from kb_index import (EMBED_MODEL, KB_PATH, TOP_K, encode_queries, encode_query,
+                      load_or_build_index)
+from kb_reload import KB_WATCH_INTERVAL, KBWatcher
+from lang import detect_language
+from lexical import RETRIEVER, LexicalIndex, hybrid_search, lexical_weight
+from metrics import (GROQ_ERRORS, TURNS, observe_stage, record_usage,
+                     register_engine, stage)
+from prompts import PromptBuilder
+from response_cache import make_cache
+from warmset import load_warmset
+
+log = logging.getLogger("vmitra.engine")
+
+# Direct KB answer (no LLM) when the best match is a curated intent example,
+# scores at least FASTPATH_THRESHOLD and beats the runner-up by FASTPATH_MARGIN.
+FASTPATH_THRESHOLD = float(os.getenv("VMITRA_FASTPATH_THRESHOLD", "0.82"))
+FASTPATH_MARGIN    = float(os.getenv("VMITRA_FASTPATH_MARGIN", "0.06"))
+
+FALLBACK_NO_KB = "Sorry, I can't answer right now. Please call 1800-233-1266 for help."
+CUT_OFF_NOTE   = "\n\n⚠️ The reply was cut off – please ask again."
+
+
+class TurnCancelled(Exception):
+    """Raised from an on_delta callback to abandon a streaming turn."""
+
+
+@dataclass
+class Retrieval:
+    text: str
+    qv: object          # normalized query vector
+    hits: list          # [(Passage, dense cosine)], best (fused) rank first
+    lang: str
+    timings: dict = field(default_factory=dict)   # stage → seconds for this turn
+    kb_generation: int = 0                        # which index snapshot answered
+
+    @property
+    def ctx_ids(self):
+        return [p.pid for p, _ in self.hits]
+
+
+@dataclass
+class Turn:
+    reply: str
+    source: str         # kb_direct | warm | cache | llm | partial | kb_fallback
+    retrieval: Retrieval
+    prompt_tokens: dict = None   # PromptBuilder breakdown when a prompt was built
+    usage: dict = None           # Groq's billed token usage for LLM replies
+    shared: bool = False         # reply came from an identical turn's in-flight call
+
+
+def has_past_turns(history):
+    """True when `history` holds a user message, i.e. the prompt will carry it."""
+    return any(role == "user" for role, _ in history)
+
+
+def kb_only_reply(hits, lang="en"):
+    """Best KB passage, used while Groq is unreachable."""
+    if not hits:
+        return FALLBACK_NO_KB
+    top = hits[0][0]
+    body = (top.answer_in(lang) or top.answer) if top.kind == "qa" else top.text
+    return ("⚠️ Our AI assistant is busy right now, so here is the closest answer "
+            f"from the V-Mitra guide:\n\n{body}\n\nIf you need more help, just ask!")
+
+
+class ChatEngine:
+    def __init__(self, embedder, index, groq, cache=None, top_k=TOP_K, model=LLM_MODEL,
+                 prompts=None, fastpath_threshold=FASTPATH_THRESHOLD,
+                 fastpath_margin=FASTPATH_MARGIN, lexical=None, admission=None,
+                 flights=None, warmset=None):
+        self.embedder = embedder
+        # (index, lexical, generation) swapped as one tuple on KB reload, so a
+        # request always searches a consistent pair; lexical None → dense only
+        self._kb = (index, lexical, 0)
+        self.groq = groq
+        self.cache = cache
+        self.top_k = top_k
+        self.model = model
+        self.prompts = prompts or PromptBuilder()
+        self.fastpath_threshold = fastpath_threshold
+        self.fastpath_margin = fastpath_margin
+        self.admission = admission      # None → every LLM call goes straight out
+        self.flights = flights          # SingleFlight; None → no coalescing
+        self.warmset = warmset          # pre-generated intent answers for this KB, or None
+
+    @property
+    def index(self):
+        return self._kb[0]
+
+    @property
+    def lexical(self):
+        return self._kb[1]
+
+    @property
+    def kb_generation(self):
+        return self._kb[2]
+
+    def swap_index(self, index, stale_pids=()):
+        """
+        Serve `index` from the next retrieval on. Requests already past
+        retrieval finish on the old snapshot; cached replies grounded on
+        `stale_pids` (edited or removed passages) are dropped.
+        """
+        lexical = LexicalIndex(index.passages) if self.lexical is not None else None
+        self._kb = (index, lexical, self._kb[2] + 1)
+        dropped = self.cache.invalidate(stale_pids) if self.cache else 0
+        log.info("KB index swapped in (generation %d, %d passages, %d cached replies dropped)",
+                 self._kb[2], len(index), dropped)
+
+    def retrieve(self, text):
+        timings = {}
+        with stage("embed", timings):
+            qv = encode_query(self.embedder, text)
+        return self._search(text, qv, timings)
+
+    def retrieve_many(self, texts):
+        """Retrievals for a batch of texts with a single embedding call (bulk jobs)."""
+        if not texts:
+            return []
+        t0 = time.perf_counter()
+        qvs = encode_queries(self.embedder, texts)
+        elapsed = time.perf_counter() - t0
+        observe_stage("embed", elapsed)
+        # each turn is charged its share of the batched forward pass
+        return [self._search(t, qv, {"embed": elapsed / len(texts)})
+                for t, qv in zip(texts, qvs)]
+
+    def _search(self, text, qv, timings):
+        index, lexical, generation = self._kb
+        lang = detect_language(text)
+        with stage("search", timings):
+            if lexical is not None:
+                hits = hybrid_search(index, lexical, qv, text, self.top_k,
+                                     lexical_weight=lexical_weight(lang))
+            else:
+                hits = index.search(qv, self.top_k)
+        return Retrieval(text, qv, hits, lang, timings, generation)
+
+    def _confident_intent(self, r):
+        """Top hit if it is a curated intent example matched confidently, else None."""
+        if not r.hits:
+            return None
+        top, score = r.hits[0]
+        # hybrid hits are in fused order, so compare against the best other cosine
+        runner_up = max((s for _, s in r.hits[1:]), default=-1.0)
+        if (top.kind != "qa" or score < self.fastpath_threshold
+                or score - runner_up < self.fastpath_margin):
+            return None
+        return top
+
+    def direct_answer(self, r):
+        """Curated KB answer for a confident intent match in the user's language, else None."""
+        top = self._confident_intent(r)
+        return top.answer_in(r.lang) if top else None
+
+    def warm_answer(self, r):
+        """
+        Pre-generated answer (warmset.py) in the user's language for a
+        confident intent match, or for a query close to one of its paraphrases.
+        """
+        warmset = self.warmset
+        if warmset is None:
+            return None
+        top = self._confident_intent(r)
+        pid = top.pid if top else warmset.match(r.qv)
+        if not pid:
+            return None
+        # examples with a curated answer in this language (English always) are
+        # left out of the table, so a paraphrase match serves the KB's own
+        example = top or next((p for p in self.index.passages if p.pid == pid), None)
+        return warmset.get(pid, r.lang) or (example.answer_in(r.lang) if example else None)
+
+    def generate(self, r, on_delta=None, history=(), client=None):
+        turn = self._generate(r, on_delta, history, client)
+        top = r.hits[0][1] if r.hits else 0.0
+        TURNS.inc(source=turn.source, lang=r.lang)
+        fields = {"event": "turn", "source": turn.source, "lang": r.lang,
+                  "top_score": round(top, 4), "passages": r.ctx_ids,
+                  "stages_ms": {k: round(v * 1000, 2) for k, v in r.timings.items()}}
+        if turn.prompt_tokens:
+            fields["prompt_tokens"] = turn.prompt_tokens
+        if turn.usage:
+            fields["usage"] = turn.usage
+        if turn.shared:
+            fields["shared"] = True
+        log.info("turn served by %s (lang=%s, top=%.3f, passage=%s)", turn.source,
+                 r.lang, top, r.ctx_ids[0] if r.hits else "-", extra={"fields": fields})
+        return turn
+
+    def _generate(self, r, on_delta, history, client):
+        """
+        Produce the reply for a retrieval. `history` is the conversation so far
+        as (role, text) pairs, oldest first. With `on_delta`, the reply is
+        streamed and on_delta(delta) is called for every chunk; raising from it
+        (e.g. TurnCancelled) aborts the turn, and closes the upstream connection
+        unless identical turns are still following the same call. `client`
+        (session id / IP) is the key for per-client rate limiting.
+        """
+        direct = self.direct_answer(r)
+        if direct:
+            if on_delta is not None:
+                on_delta(direct)
+            return Turn(direct, "kb_direct", r)
+
+        warm = self.warm_answer(r)
+        if warm:
+            if on_delta is not None:
+                on_delta(warm)
+            return Turn(warm, "warm", r)
+
+        # a reply shaped by earlier turns is only right for this conversation
+        standalone = not has_past_turns(history)
+        if self.cache and standalone:
+            cached = self.cache.lookup(r.qv, r.ctx_ids, r.lang)
+            if cached is not None:
+                if on_delta is not None:
+                    on_delta(cached)
+                return Turn(cached, "cache", r)
+
+        # the flight key leaves out the history, so only standalone turns share
+        if self.flights is None or not standalone:
+            return self._admitted_turn(r, on_delta, history, client)
+        # every turn pays its own client's token, whether it leads the call or
+        # follows one; the leader then only needs an LLM slot
+        if self.admission is not None:
+            try:
+                self.admission.charge(client)
+            except AdmissionDenied as e:
+                return self._denied(r, e)
+        client = None
+        while True:
+            flight, first = self.flights.join(flight_key(r))
+            if first:
+                return self._lead(flight, r, on_delta, history, client)
+            try:
+                with stage("coalesced", r.timings):
+                    turn = self.flights.follow(flight, on_delta)
+            except AdmissionDenied:
+                # the leader found no slot; go again, maybe leading this time
+                # (no delta precedes admission)
+                continue
+            COALESCED.inc()
+            return Turn(turn.reply, turn.source, r, turn.prompt_tokens, shared=True)
+
+    def _lead(self, flight, r, on_delta, history, client):
+        def call(publish):
+            def relay(delta):
+                try:
+                    publish(delta)
+                except Abandoned:
+                    raise TurnCancelled() from None
+            # always streamed, so followers that stream get the deltas even
+            # when this turn itself is blocking
+            return self._admitted(r, relay, history, client)
+        self.flights.start(flight, call)
+        try:
+            return self.flights.follow(flight, on_delta)
+        except AdmissionDenied as e:
+            return self._denied(r, e)
+
+    def _admitted_turn(self, r, on_delta, history, client):
+        try:
+            return self._admitted(r, on_delta, history, client)
+        except AdmissionDenied as e:
+            return self._denied(r, e)
+
+    def _admitted(self, r, on_delta, history, client):
+        """The LLM turn once `client` is admitted; raises AdmissionDenied."""
+        if self.admission is None:
+            return self._llm_turn(r, on_delta, history)
+        with stage("admission", r.timings):
+            self.admission.acquire(client)
+        try:
+            return self._llm_turn(r, on_delta, history)
+        finally:
+            self.admission.release()
+
+    def _denied(self, r, e):
+        if self.admission.overflow == "reject":
+            raise e
+        log.warning("LLM call not admitted (%s), serving KB-only reply", e.reason)
+        return Turn(kb_only_reply(r.hits, r.lang), "kb_fallback", r)
+
+    def _llm_turn(self, r, on_delta, history):
+        with stage("prompt", r.timings):
+            prompt = self.prompts.build(r.hits, r.text, history, lang=r.lang)
+        log.info("prompt tokens %s (passages=%d, turns kept=%d, summarized=%d)",
+                 prompt.tokens, len(prompt.passages), prompt.history_kept,
+                 prompt.history_summarized)
+        payload = {"model": self.model, "messages": prompt.messages}
+        t0 = time.perf_counter()
+        try:
+            if on_delta is None:
+                completion = self.groq.completion(payload)
+                observe_stage("groq_ttfb", completion.ttfb, r.timings)
+                reply, usage = completion.text, completion.usage
+            else:
+                with self.groq.stream(payload) as stream:
+                    for delta in stream:
+                        if "groq_ttfb" not in r.timings:
+                            observe_stage("groq_ttfb", time.perf_counter() - t0, r.timings)
+                        on_delta(delta)
+                reply, usage = stream.text.strip(), stream.usage
+        except GroqStreamError as e:
+            GROQ_ERRORS.inc(kind="stream")
+            # keep whatever already reached the user instead of dropping the turn
+            if e.partial.strip():
+                return Turn(e.partial.strip() + CUT_OFF_NOTE, "partial", r, prompt.tokens)
+            log.warning("Groq stream failed before any token: %s", e)
+            return Turn(kb_only_reply(r.hits, r.lang), "kb_fallback", r, prompt.tokens)
+        except (GroqError, requests.exceptions.RequestException) as e:
+            GROQ_ERRORS.inc(kind="unavailable" if isinstance(e, GroqUnavailable) else "http")
+            log.warning("Groq call failed, serving KB-only reply: %s", e)
+            return Turn(kb_only_reply(r.hits, r.lang), "kb_fallback", r, prompt.tokens)
+        except TurnCancelled:
+            raise
+        except Exception:
+            GROQ_ERRORS.inc(kind="unexpected")
+            log.exception("Unexpected error while calling Groq")
+            return Turn(kb_only_reply(r.hits, r.lang), "kb_fallback", r, prompt.tokens)
+        finally:
+            observe_stage("groq_total", time.perf_counter() - t0, r.timings)
+
+        record_usage(usage)
+        # a reply grounded on a since-replaced index must not outlive the reload,
+        # and one that saw the conversation's history must not reach other users
+        if (self.cache and r.kb_generation == self.kb_generation
+                and not prompt.history_kept and not prompt.history_summarized):
+            self.cache.store(r.qv, r.ctx_ids, r.lang, r.text, reply)
+        return Turn(reply, "llm", r, prompt.tokens, usage)
+
+    def respond(self, text, on_delta=None, history=(), client=None):
+        return self.generate(self.retrieve(text), on_delta, history, client)
+
+
+def build_engine(api_key, url=GROQ_API_URL, kb_path=KB_PATH, model_name=EMBED_MODEL,
+                 backend=EMBED_BACKEND):
+    # VMITRA_EMBED_BACKEND=onnx|onnx-int8 avoids importing torch at all
+    embedder = load_embedder(backend, model_name)
+    # a remote embedder reports the model the shared server has loaded
+    model_id = getattr(embedder, "model_id", None) or embedder_id(backend, model_name)
+    index = load_or_build_index(lambda: embedder, kb_path, model_id)
+    # concurrent queries share forward passes; VMITRA_BATCH_WINDOW_MS=0 disables.
+    # The shared server batches across workers already.
+    if BATCH_WINDOW_MS > 0 and BATCH_MAX > 1 and backend != "remote":
+        embedder = EmbeddingBatcher(embedder, BATCH_WINDOW_MS, BATCH_MAX)
+    lexical = LexicalIndex(index.passages) if RETRIEVER == "hybrid" else None
+    engine = ChatEngine(embedder, index, GroqClient(api_key, url), make_cache(),
+                        lexical=lexical, admission=make_admission(), flights=make_flights(),
+                        warmset=load_warmset(kb_path, embedder=embedder))
+    register_engine(engine)
+    if KB_WATCH_INTERVAL > 0:
+        engine.watcher = KBWatcher(engine, kb_path, model_id).start()
+    return engine
@@ -0,0 +1,191 @@
+"""
+Retrieval quality + latency evaluation.
+
+Labeled queries come from three places:
+
+    intents    every `sample_intents_entities` example → its intent's passages
+    sections   each section/item title (e.g. "Photo Upload (Evidence)") → that item
+    corpus     bench/corpus.jsonl paraphrases in en / hi / hinglish, with the
+               pid prefixes that answer them
+
+Each retriever configuration is scored on recall@k (a relevant passage in the
+top k), MRR and top-1 accuracy, next to the query encode and search latency,
+so a change of chunking, model or fusion weight can be judged on quality per
+millisecond rather than by feel.
+
+    python eval_retrieval.py
+    python eval_retrieval.py --backends st,onnx-int8 --configs dense,hybrid --json eval.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from embedders import BACKENDS, EMBED_BACKEND, embedder_id, load_embedder
+from kb_index import KB_PATH, encode_query, iter_passages, load_kb, load_or_build_index
+from lang import detect_language
+from lexical import LexicalIndex, hybrid_search, lexical_weight
+
+CORPUS_PATH = os.path.join("bench", "corpus.jsonl")
+KS          = (1, 3, 5, 10)
+CONFIGS     = ("dense", "lexical", "hybrid", "hybrid-lex0.5", "hybrid-lex2", "hybrid-lang")
+
+
+# ────────────────────────────────
+# Labeled set
+# ────────────────────────────────
+def _node(pid):
+    """'section/item' part of a passage id, without row / chunk suffixes."""
+    parts = pid.split("#")[0].split("/")
+    return "/".join(parts[:2]).split("[")[0]
+
+
+def labeled_set(kb_path=KB_PATH, corpus_path=CORPUS_PATH):
+    """[{"set", "query", "relevant": [pid prefixes]}]."""
+    passages = iter_passages(load_kb(kb_path))
+    items = []
+    for p in passages:
+        if p.kind == "qa":
+            items.append({"set": "intents", "query": p.text,
+                          "relevant": [f"{p.section}/{p.intent}"]})
+    seen = set()
+    for p in passages:
+        node, crumbs = _node(p.pid), p.title.split(" › ")
+        if p.kind == "qa" or "/" not in node or node in seen or len(crumbs) < 2:
+            continue
+        seen.add(node)
+        items.append({"set": "sections", "query": crumbs[1], "relevant": [node]})
+    if corpus_path and os.path.exists(corpus_path):
+        with open(corpus_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    items.append({"set": f"corpus-{row['lang']}", "query": row["query"],
+                                  "relevant": row["relevant"]})
+    return items
+
+
+def is_relevant(pid, prefixes):
+    return any(pid == p or (pid.startswith(p) and pid[len(p)] in "/#[") for p in prefixes)
+
+
+# ────────────────────────────────
+# Retrievers under test
+# ────────────────────────────────
+def retrievers(index, lexical):
+    """name → fn(qv, text, k) returning passages, best first."""
+    def lexical_only(qv, text, k):
+        return [index.passages[i] for i, _ in lexical.search(text, k)]
+
+    def hybrid(weight):
+        return lambda qv, text, k: [p for p, _ in hybrid_search(index, lexical, qv, text, k,
+                                                                 lexical_weight=weight)]
+
+    def by_language(qv, text, k):
+        # what ChatEngine serves: the weight follows the query's language
+        return hybrid(lexical_weight(detect_language(text)))(qv, text, k)
+    return {"dense": lambda qv, text, k: [p for p, _ in index.search(qv, k)],
+            "lexical": lexical_only,
+            "hybrid": hybrid(1.0),
+            "hybrid-lex0.5": hybrid(0.5),
+            "hybrid-lex2": hybrid(2.0),
+            "hybrid-lang": by_language}
+
+
+def _ms(samples):
+    a = np.asarray(samples) * 1000.0
+    return {"p50": float(np.percentile(a, 50)), "p95": float(np.percentile(a, 95))}
+
+
+def score(ranked_pids, relevant, ks=KS):
+    rank = next((i + 1 for i, pid in enumerate(ranked_pids) if is_relevant(pid, relevant)), None)
+    out = {f"recall@{k}": float(rank is not None and rank <= k) for k in ks}
+    out["mrr"] = 1.0 / rank if rank else 0.0
+    return out
+
+
+def evaluate(items, embedder, index, lexical, configs=CONFIGS, ks=KS):
+    """Per-config quality (overall and per set) plus encode/search latency."""
+    fns = retrievers(index, lexical)
+    depth = max(ks)
+    encode_t = []
+    per = {c: {"search": [], "scores": []} for c in configs}
+    for item in items:
+        t0 = time.perf_counter()
+        qv = encode_query(embedder, item["query"])
+        encode_t.append(time.perf_counter() - t0)
+        for c in configs:
+            t0 = time.perf_counter()
+            ranked = fns[c](qv, item["query"], depth)
+            per[c]["search"].append(time.perf_counter() - t0)
+            per[c]["scores"].append((item["set"], score([p.pid for p in ranked],
+                                                        item["relevant"], ks)))
+    encode_ms = _ms(encode_t)
+    results = {}
+    for c in configs:
+        sets = {}
+        for name, s in per[c]["scores"]:
+            sets.setdefault(name, []).append(s)
+        sets["all"] = [s for _, s in per[c]["scores"]]
+        metrics = {name: {m: float(np.mean([s[m] for s in rows])) for m in rows[0]}
+                   | {"n": len(rows)} for name, rows in sets.items()}
+        search_ms = _ms(per[c]["search"])
+        total = encode_ms["p50"] + search_ms["p50"]
+        results[c] = {"quality": metrics, "encode_ms": encode_ms, "search_ms": search_ms,
+                      "mrr_per_ms": metrics["all"]["mrr"] / total if total else 0.0}
+    return results
+
+
+def _print(backend, results, ks):
+    cols = [f"R@{k}" for k in ks] + ["MRR", "top1", "enc p50", "srch p50", "srch p95", "MRR/ms"]
+    print(f"\n[{backend}]  {'config':<14}" + "".join(f"{c:>9}" for c in cols))
+    for c, r in results.items():
+        q = r["quality"]["all"]
+        vals = [q[f"recall@{k}"] for k in ks] + [q["mrr"], q["recall@1"]]
+        print(" " * (len(backend) + 4) + f"{c:<14}" + "".join(f"{v:>9.3f}" for v in vals)
+              + f"{r['encode_ms']['p50']:>9.2f}{r['search_ms']['p50']:>9.3f}"
+              f"{r['search_ms']['p95']:>9.3f}{r['mrr_per_ms']:>9.3f}")
+    sets = [s for s in next(iter(results.values()))["quality"] if s != "all"]
+    print(" " * (len(backend) + 4) + "MRR by set:  " + "  ".join(f"{s}" for s in sets))
+    for c, r in results.items():
+        print(" " * (len(backend) + 4) + f"{c:<14}"
+              + "".join(f"{r['quality'][s]['mrr']:>{len(s) + 2}.3f}" for s in sets))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Retrieval quality + latency evaluation")
+    ap.add_argument("--kb", default=KB_PATH)
+    ap.add_argument("--corpus", default=CORPUS_PATH)
+    ap.add_argument("--backends", default=EMBED_BACKEND,
+                    help=f"comma-separated, from {', '.join(BACKENDS)}")
+    ap.add_argument("--configs", default=",".join(CONFIGS))
+    ap.add_argument("--json", help="write all results here")
+    args = ap.parse_args(argv)
+
+    items = labeled_set(args.kb, args.corpus)
+    configs = [c for c in args.configs.split(",") if c]
+    print(f"{len(items)} labeled queries: " + ", ".join(
+        f"{s}={sum(1 for i in items if i['set'] == s)}"
+        for s in sorted({i['set'] for i in items})))
+
+    report = {}
+    for backend in [b for b in args.backends.split(",") if b]:
+        embedder = load_embedder(backend)
+        model_id = getattr(embedder, "model_id", None) or embedder_id(backend)
+        index = load_or_build_index(lambda: embedder, args.kb, model_id)
+        lexical = LexicalIndex(index.passages)
+        encode_query(embedder, "warm up")
+        report[backend] = evaluate(items, embedder, index, lexical, configs)
+        _print(backend, report[backend], KS)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""
+Groq (OpenAI-compatible) chat-completions client: pooled keep-alive session,
+retries with backoff, a circuit breaker, and blocking or streaming calls.
+
+Streaming uses `stream: true`, which answers with server-sent events:
+
+    data: {"choices":[{"delta":{"content":"Hel"}}]}
+    data: {"choices":[{"delta":{"content":"lo"}}]}
+    data: [DONE]
+
+Network chunks do not line up with events, so bytes are buffered and split on
+newlines here instead of trusting each chunk to be a full event.
+"""
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+LLM_MODEL    = "llama-3.1-8b-instant"
+TIMEOUT      = (5, 30)   # (connect, read-between-bytes) seconds
+
+
+class GroqError(Exception):
+    """Base class for Groq call failures."""
+
+
+class GroqUnavailable(GroqError):
+    """Circuit open or retries exhausted – answer from the KB instead."""
+
+
+class GroqStreamError(GroqError):
+    """The stream broke after it started; `partial` holds the text received so far."""
+
+    def __init__(self, message, partial=""):
+        super().__init__(message)
+        self.partial = partial
+
+
+@dataclass
+class Completion:
+    text: str
+    usage: dict = None      # prompt_tokens / completion_tokens / total_tokens
+    ttfb: float = 0.0       # seconds until the response headers arrived
+
+
+def _headers(api_key):
+    return {"Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"}
+
+
+def iter_sse_events(chunks):
+    """
+    Turn an iterable of raw byte chunks into SSE `data` payloads (str).
+    Handles events split across chunks, CRLF line endings, comment lines and
+    multi-line data fields. Stops at the `[DONE]` sentinel.
+    """
+    buf = b""
+    data = []
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buf += chunk
+        # only complete lines are decoded, so multi-byte UTF-8 never gets cut
+        *lines, buf = buf.split(b"\n")
+        for raw in lines:
+            line = raw.rstrip(b"\r").decode("utf-8")
+            if not line:                      # blank line = end of event
+                if data:
+                    payload = "\n".join(data)
+                    data = []
+                    if payload.strip() == "[DONE]":
+                        return
+                    yield payload
+            elif line.startswith(":"):        # keep-alive comment
+                continue
+            elif line.startswith("data:"):
+                data.append(line[5:].lstrip(" "))
+    # connection closed without a trailing blank line
+    tail = buf.rstrip(b"\r").decode("utf-8", errors="replace")
+    if tail.startswith("data:"):
+        data.append(tail[5:].lstrip(" "))
+    if data:
+        payload = "\n".join(data)
+        if payload.strip() != "[DONE]":
+            yield payload
+
+
+class ChatStream:
+    """
+    Iterate to receive content deltas as they arrive. Always closed on exit
+    (use as a context manager) so an abandoned stream – e.g. Streamlit
+    interrupting the script for a new message – releases the connection.
+    """
+
+    def __init__(self, response, breaker=None):
+        self.response = response
+        self.breaker = breaker
+        self.text = ""
+        self.finish_reason = None
+        self.usage = None
+        self.done = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self.response.close()
+
+    def __iter__(self):
+        try:
+            for payload in iter_sse_events(self.response.iter_content(chunk_size=None)):
+                try:
+                    event = json.loads(payload)
+                except ValueError:
+                    raise GroqStreamError(f"malformed stream event: {payload[:200]}", self.text)
+                if "error" in event:
+                    err = event["error"]
+                    msg = err.get("message", err) if isinstance(err, dict) else err
+                    raise GroqStreamError(f"Groq stream error: {msg}", self.text)
+                # Groq reports usage on the final chunk under x_groq
+                usage = event.get("usage") or (event.get("x_groq") or {}).get("usage")
+                if usage:
+                    self.usage = usage
+                for choice in event.get("choices", []):
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        self.text += delta
+                        yield delta
+                    if choice.get("finish_reason"):
+                        self.finish_reason = choice["finish_reason"]
+            if self.finish_reason is None:
+                raise GroqStreamError("stream ended before the reply was complete", self.text)
+            self.done = True
+        except requests.exceptions.RequestException as e:
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            raise GroqStreamError(f"connection lost mid-stream: {e}", self.text) from e
+        finally:
+            self.close()
+
+
+# ────────────────────────────────
+# Resilient client
+# ────────────────────────────────
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def retry_after_seconds(value, now=None):
+    """Parse a Retry-After header (delta-seconds or HTTP-date); None if absent/bad."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (now if now is not None else time.time()))
+
+
+class CircuitBreaker:
+    """
+    closed     → calls flow; `failure_threshold` consecutive failures open it
+    open       → calls are refused until `reset_after` seconds have passed
+    half_open  → one probe call is let through; success closes, failure re-opens
+    """
+
+    def __init__(self, failure_threshold=5, reset_after=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and self.clock() - self.opened_at >= self.reset_after:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = self.clock()
+                self._probing = False
+
+
+class GroqClient:
+    """
+    Pooled keep-alive session to the chat-completions endpoint.
+
+    Connection errors, timeouts, 429 and 5xx are retried with full-jitter
+    exponential backoff; a 429 `Retry-After` is honored when it is short enough
+    to be worth waiting for. Only the request *opening* is retried for streams –
+    once tokens have reached the user a retry would duplicate them.
+    """
+
+    def __init__(self, api_key, url=GROQ_API_URL, timeout=TIMEOUT, max_retries=3,
+                 backoff_base=0.5, backoff_cap=8.0, max_retry_after=20.0,
+                 pool_size=16, breaker=None, sleep=time.sleep):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_retry_after = max_retry_after
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+        self.retries = 0            # total retry attempts, for metrics
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(_headers(api_key))
+
+    @property
+    def healthy(self):
+        return self.breaker.state == "closed"
+
+    def close(self):
+        self.session.close()
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _post(self, payload, stream):
+        if not self.breaker.allow():
+            raise GroqUnavailable("Groq circuit open – skipping call")
+        headers = {"Accept": "text/event-stream"} if stream else None
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+            try:
+                r = self.session.post(self.url, json=payload, headers=headers,
+                                      timeout=self.timeout, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                last_error = e
+                delay = self._backoff(attempt)
+            else:
+                if r.status_code < 400:
+                    self.breaker.record_success()
+                    return r
+                r.content   # drain so the pooled connection can be reused
+                r.close()
+                if r.status_code not in RETRYABLE_STATUS:
+                    # our request is wrong (auth, payload) – retrying won't help
+                    self.breaker.record_success()
+                    r.raise_for_status()
+                last_error = requests.exceptions.HTTPError(
+                    f"{r.status_code} from Groq: {r.text[:200]}", response=r)
+                delay = self._backoff(attempt)
+                if r.status_code == 429:
+                    wait = retry_after_seconds(r.headers.get("Retry-After"))
+                    if wait is not None:
+                        if wait > self.max_retry_after:
+                            break
+                        delay = wait + random.uniform(0, self.backoff_base)
+            if attempt < self.max_retries:
+                self.sleep(delay)
+        self.breaker.record_failure()
+        raise GroqUnavailable(f"Groq unavailable: {last_error}") from last_error
+
+    def complete(self, payload):
+        """Blocking completion; returns the reply text."""
+        return self.completion(payload).text
+
+    def completion(self, payload):
+        """Blocking completion with Groq's token usage and time to first byte."""
+        r = self._post(payload, stream=False)
+        body = r.json()
+        return Completion(body["choices"][0]["message"]["content"].strip(),
+                          body.get("usage"), r.elapsed.total_seconds())
+
+    def stream(self, payload):
+        """Streaming completion; iterate the returned ChatStream for deltas."""
+        return ChatStream(self._post({**payload, "stream": True}, stream=True), self.breaker)
@@ -0,0 +1,462 @@
+"""
+Chunking + dense index over the whole V-Mitra knowledge base.
+
+Every section of vmitra_knowledge_base.json is walked into small passages
+(items, subsections, steps, table rows, intent examples) that keep their
+section/title metadata, so retrieval can hit any part of the guide instead
+of only the sample intent questions.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+
+KB_PATH        = "vmitra_knowledge_base.json"
+EMBED_MODEL    = "all-MiniLM-L6-v2"
+INDEX_DIR      = os.getenv("VMITRA_INDEX_DIR", ".vmitra_index")
+INDEX_VERSION  = 2      # bump when the chunker or artifact layout changes
+MAX_CHARS      = 1200   # longer items get split on line boundaries
+EMBED_BATCH    = 64
+TOP_K          = 4
+
+# keys that only carry identifiers / ordering, never useful text
+_SKIP_KEYS  = {"id", "step"}
+_TITLE_KEYS = ("title", "category", "scenario", "intent", "appliance")
+# free-text keys whose label adds nothing ("Content: …")
+_BARE_KEYS  = {"content", "description"}
+
+
+@dataclass(frozen=True)
+class Passage:
+    pid: str            # stable id, e.g. "reporting_paths/ivrs_available_path"
+    section: str        # section id
+    title: str          # human title (section › item)
+    text: str           # body used for retrieval / context
+    kind: str = "content"   # content | table_row | qa | purpose
+    answer: str = ""    # curated answer for kind == "qa"
+    intent: str = ""    # intent name for kind == "qa"
+    # curated answer in other languages, e.g. {"hi": "...", "hinglish": "..."}
+    translations: dict = field(default_factory=dict, hash=False)
+
+    def answer_in(self, lang):
+        """Curated answer in `lang` if stored ("en" is the answer itself)."""
+        if lang == "en":
+            return self.answer or None
+        return self.translations.get(lang)
+
+    @property
+    def embed_text(self):
+        # intent examples are matched on the question, like the old index
+        if self.kind == "qa":
+            return self.text
+        return f"{self.title}: {self.text}"
+
+    def render(self):
+        if self.kind == "qa":
+            return f"Q: {self.text}\nA: {self.answer}"
+        return f"{self.title}\n{self.text}"
+
+
+# ────────────────────────────────
+# Chunking
+# ────────────────────────────────
+def load_kb(path=KB_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["v_mitra_knowledge_base"]
+
+
+def _label(key):
+    return key.replace("_", " ").capitalize()
+
+
+def _is_table(value):
+    """A list of flat dicts (reward_matrix, applicability, …)."""
+    return (isinstance(value, list) and value
+            and all(isinstance(v, dict) for v in value)
+            and all(not isinstance(x, (dict, list)) for v in value for x in v.values()))
+
+
+def _title_key(obj):
+    for k in _TITLE_KEYS:
+        if isinstance(obj.get(k), str) and obj[k].strip():
+            return k
+    return None
+
+
+def _title_of(obj, fallback):
+    k = _title_key(obj)
+    return obj[k].strip() if k else fallback
+
+
+def _flatten(obj, indent=""):
+    """Render nested JSON as readable 'Label: value' / bullet lines."""
+    lines = []
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            if k in _SKIP_KEYS:
+                continue
+            if isinstance(v, (dict, list)):
+                sub = _flatten(v, indent + "  ")
+                if sub:
+                    lines.append(f"{indent}{_label(k)}:")
+                    lines.extend(sub)
+            elif str(v).strip():
+                lines.append(f"{indent}{v}" if k in _BARE_KEYS
+                             else f"{indent}{_label(k)}: {v}")
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj, 1):
+            if isinstance(v, dict):
+                step = v.get("step", i)
+                sub = _flatten(v, indent + "  ")
+                if sub:
+                    lines.append(f"{indent}{step}.")
+                    lines.extend(sub)
+            elif isinstance(v, list):
+                lines.extend(_flatten(v, indent + "  "))
+            elif str(v).strip():
+                lines.append(f"{indent}- {v}")
+    elif str(obj).strip():
+        lines.append(f"{indent}{obj}")
+    return lines
+
+
+def _split(text, limit=MAX_CHARS):
+    """Split long text on line boundaries into <= limit sized pieces."""
+    if len(text) <= limit:
+        return [text]
+    parts, cur, size = [], [], 0
+    for line in text.split("\n"):
+        if cur and size + len(line) + 1 > limit:
+            parts.append("\n".join(cur))
+            cur, size = [], 0
+        # a single huge line still has to be cut somewhere
+        while len(line) > limit:
+            parts.append(line[:limit])
+            line = line[limit:]
+        cur.append(line)
+        size += len(line) + 1
+    if cur:
+        parts.append("\n".join(cur))
+    return parts
+
+
+def _row_text(row):
+    return "; ".join(f"{_label(k)}: {v}" for k, v in row.items()
+                     if k not in _SKIP_KEYS and str(v).strip())
+
+
+def _emit(out, pid, section, title, text, kind="content"):
+    text = text.strip()
+    if not text:
+        return
+    pieces = _split(text)
+    for n, piece in enumerate(pieces):
+        out.append(Passage(pid if len(pieces) == 1 else f"{pid}#{n}",
+                           section, title, piece, kind))
+
+
+def _chunk_item(out, sec_id, sec_title, key, idx, item):
+    base  = f"{sec_id}/{item.get('id') or f'{key}[{idx}]'}"
+    title = f"{sec_title} › {_title_of(item, _label(key))}"
+
+    # tables nested inside an item become one passage per row
+    tkey = _title_key(item)
+    body = {}
+    for k, v in item.items():
+        if _is_table(v):
+            for r, row in enumerate(v):
+                _emit(out, f"{base}/{k}[{r}]", sec_id,
+                      f"{title} › {_title_of(row, _label(k))}",
+                      _row_text(row), "table_row")
+        elif k != tkey:
+            body[k] = v
+    _emit(out, base, sec_id, title, "\n".join(_flatten(body)))
+
+
+def iter_passages(kb):
+    """Walk every section of the KB into a flat list of Passage objects."""
+    out = []
+    for sec in kb["sections"]:
+        sec_id, sec_title = sec["id"], sec.get("title", sec["id"])
+        if sec.get("purpose"):
+            out.append(Passage(f"{sec_id}#purpose", sec_id, sec_title,
+                               sec["purpose"], "purpose"))
+        for key, value in sec.items():
+            if key in ("id", "title", "purpose"):
+                continue
+            if key == "intents":
+                for intent in value:
+                    for i, ex in enumerate(intent.get("examples", [])):
+                        out.append(Passage(f"{sec_id}/{intent['intent']}[{i}]",
+                                           sec_id, intent["intent"],
+                                           ex["question"], "qa",
+                                           answer=ex["answer"],
+                                           intent=intent["intent"],
+                                           translations=dict(ex.get("answer_translations") or {})))
+            elif _is_table(value):
+                for r, row in enumerate(value):
+                    _emit(out, f"{sec_id}/{key}[{r}]", sec_id,
+                          f"{sec_title} › {_title_of(row, _label(key))}",
+                          _row_text(row), "table_row")
+            elif isinstance(value, list):
+                for i, item in enumerate(value):
+                    if isinstance(item, dict):
+                        _chunk_item(out, sec_id, sec_title, key, i, item)
+                    else:
+                        _emit(out, f"{sec_id}/{key}[{i}]", sec_id,
+                              f"{sec_title} › {_label(key)}", str(item))
+            elif isinstance(value, dict):
+                _emit(out, f"{sec_id}/{key}", sec_id,
+                      f"{sec_title} › {_label(key)}", "\n".join(_flatten(value)))
+            else:
+                _emit(out, f"{sec_id}/{key}", sec_id, sec_title,
+                      f"{_label(key)}: {value}")
+    return out
+
+
+# ────────────────────────────────
+# Embedding + search
+# ────────────────────────────────
+def embed_passages(embedder, passages, batch_size=EMBED_BATCH):
+    """Encode passages in fixed-size batches into one normalized float32 matrix."""
+    embs = None
+    for start in range(0, len(passages), batch_size):
+        batch = [p.embed_text for p in passages[start:start + batch_size]]
+        e = np.asarray(embedder.encode(batch, batch_size=batch_size,
+                                       convert_to_numpy=True), dtype=np.float32)
+        if embs is None:
+            embs = np.empty((len(passages), e.shape[1]), dtype=np.float32)
+        embs[start:start + len(batch)] = e
+    if embs is None:
+        return np.zeros((0, 0), dtype=np.float32)
+    embs /= np.maximum(np.linalg.norm(embs, axis=1, keepdims=True), 1e-12)
+    return embs
+
+
+class KBIndex:
+    """Passages plus their normalized embedding matrix (one row per passage)."""
+
+    def __init__(self, passages, embs):
+        assert len(passages) == len(embs), "passages / embeddings mismatch"
+        self.passages = list(passages)
+        self.embs = embs
+
+    def __len__(self):
+        return len(self.passages)
+
+    def scores(self, qv):
+        return self.embs @ qv
+
+    def search(self, qv, k=TOP_K):
+        """Top-k (passage, cosine) pairs for a normalized query vector."""
+        sims = self.scores(qv)
+        k = min(k, len(sims))
+        if k <= 0:
+            return []
+        # argpartition keeps this O(n) as the KB grows
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return [(self.passages[i], float(sims[i])) for i in top]
+
+
+def build_index(embedder, kb=None, batch_size=EMBED_BATCH, previous=None):
+    """
+    Chunk + embed the KB in memory (see load_or_build_index for the cached path).
+    With `previous`, passages whose embed text is unchanged reuse its vectors,
+    so only added or edited passages go through the model.
+    """
+    passages = iter_passages(kb if kb is not None else load_kb())
+    if previous is None or not len(previous):
+        return KBIndex(passages, embed_passages(embedder, passages, batch_size))
+    known = {}
+    for i, p in enumerate(previous.passages):
+        known.setdefault(passage_digest(p), i)
+    rows = [known.get(passage_digest(p)) for p in passages]
+    todo = [i for i, r in enumerate(rows) if r is None]
+    embs = np.empty((len(passages), previous.embs.shape[1]), dtype=np.float32)
+    for i, r in enumerate(rows):
+        if r is not None:
+            embs[i] = previous.embs[r]
+    if todo:
+        embs[todo] = embed_passages(embedder, [passages[i] for i in todo], batch_size)
+    return KBIndex(passages, embs)
+
+
+def passage_digest(p):
+    """Content hash of what gets embedded; equal digests share a vector."""
+    return hashlib.sha1(p.embed_text.encode("utf-8")).hexdigest()
+
+
+def diff_passages(old, new):
+    """(added, changed, removed) pids between two passage lists."""
+    before = {p.pid: p for p in old}
+    after = {p.pid: p for p in new}
+    added = after.keys() - before.keys()
+    removed = before.keys() - after.keys()
+    changed = {pid for pid in after.keys() & before.keys() if after[pid] != before[pid]}
+    return added, changed, removed
+
+
+def encode_query(embedder, text):
+    qv = np.asarray(embedder.encode([text])[0], dtype=np.float32)
+    return qv / max(float(np.linalg.norm(qv)), 1e-12)
+
+
+def encode_queries(embedder, texts, batch_size=EMBED_BATCH):
+    """Normalized query vectors for many texts in one encode call (bulk jobs)."""
+    qvs = np.asarray(embedder.encode(list(texts), batch_size=batch_size), dtype=np.float32)
+    return qvs / np.maximum(np.linalg.norm(qvs, axis=1, keepdims=True), 1e-12)
+
+
+# ────────────────────────────────
+# On-disk artifact (mmap'd at startup)
+# ────────────────────────────────
+#   <INDEX_DIR>/<model>-<key[:16]>/
+#       manifest.json   version, kb hash, model, shape
+#       passages.json   passage table, same row order as embs
+#       embs.npy        normalized float32 matrix
+def index_key(kb_path=KB_PATH, model_name=EMBED_MODEL):
+    """Hash of the KB bytes + model + artifact version; changes force a rebuild."""
+    h = hashlib.sha256()
+    with open(kb_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    h.update(f"|{model_name}|v{INDEX_VERSION}|{MAX_CHARS}".encode())
+    return h.hexdigest()
+
+
+def _artifact_dir(index_dir, key, model_name):
+    slug = model_name.replace("/", "_")
+    return os.path.join(index_dir, f"{slug}-{key[:16]}")
+
+
+def save_index(index, key, model_name=EMBED_MODEL, index_dir=INDEX_DIR):
+    """Write the artifact to a temp dir, then rename it into place atomically."""
+    os.makedirs(index_dir, exist_ok=True)
+    final = _artifact_dir(index_dir, key, model_name)
+    tmp = tempfile.mkdtemp(prefix=".build-", dir=index_dir)
+    try:
+        np.save(os.path.join(tmp, "embs.npy"),
+                np.ascontiguousarray(index.embs, dtype=np.float32))
+        with open(os.path.join(tmp, "passages.json"), "w", encoding="utf-8") as f:
+            json.dump([asdict(p) for p in index.passages], f, ensure_ascii=False)
+        manifest = {"version": INDEX_VERSION, "key": key, "model": model_name,
+                    "rows": len(index), "dim": int(index.embs.shape[1]) if len(index) else 0,
+                    "built_at": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+        # manifest last: a dir without one is never considered complete
+        with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.chmod(tmp, 0o755)        # mkdtemp makes it 0700; other users read the index
+        if os.path.isdir(final):
+            shutil.rmtree(final)
+        os.replace(tmp, final)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return final
+
+
+def load_index(key, model_name=EMBED_MODEL, index_dir=INDEX_DIR):
+    """Memory-map a previously saved artifact; None if missing or stale."""
+    path = _artifact_dir(index_dir, key, model_name)
+    try:
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if (manifest.get("version") != INDEX_VERSION or manifest.get("key") != key
+                or manifest.get("model") != model_name):
+            return None
+        with open(os.path.join(path, "passages.json"), encoding="utf-8") as f:
+            passages = [Passage(**p) for p in json.load(f)]
+        embs = np.load(os.path.join(path, "embs.npy"), mmap_mode="r")
+    except (OSError, ValueError, TypeError):
+        return None
+    if len(passages) != embs.shape[0]:
+        return None
+    return KBIndex(passages, embs)
+
+
+def prune_artifacts(keep, model_name=EMBED_MODEL, index_dir=INDEX_DIR):
+    """Remove older artifacts of the same model (previous KB versions)."""
+    if not os.path.isdir(index_dir):
+        return
+    pattern = re.compile(re.escape(model_name.replace("/", "_")) + r"-[0-9a-f]{16}")
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if (pattern.fullmatch(name) and os.path.isdir(path)
+                and os.path.abspath(path) != os.path.abspath(keep)):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def load_or_build_index(get_embedder, kb_path=KB_PATH, model_name=EMBED_MODEL,
+                        index_dir=INDEX_DIR, force=False, previous=None):
+    """
+    Return the KB index, mmap'd from disk when the artifact matches the current
+    KB + model. `get_embedder` is only called when a (re)build is needed; a
+    `previous` index (hot reload) limits that rebuild to changed passages.
+    """
+    key = index_key(kb_path, model_name)
+    if not force:
+        index = load_index(key, model_name, index_dir)
+        if index is not None:
+            return index
+    index = build_index(get_embedder(), load_kb(kb_path), previous=previous)
+    try:
+        path = save_index(index, key, model_name, index_dir)
+        prune_artifacts(path, model_name, index_dir)
+        # re-open through mmap so every process shares the page cache
+        return load_index(key, model_name, index_dir) or index
+    except OSError:
+        # read-only filesystem etc. – still serve from memory
+        return index
+
+
+# ────────────────────────────────
+# CLI:  python kb_index.py build      (e.g. at image-build time)
+#       python kb_index.py info
+# ────────────────────────────────
+def _load_model(backend, model_name):
+    from embedders import load_embedder    # lazy: embedders imports this module
+    return load_embedder(backend, model_name)
+
+
+def _model_id(backend, model_name):
+    from embedders import embedder_id
+    return embedder_id(backend, model_name)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Build / inspect the V-Mitra KB embedding index")
+    ap.add_argument("command", choices=["build", "info"])
+    ap.add_argument("--kb", default=KB_PATH)
+    ap.add_argument("--model", default=EMBED_MODEL)
+    ap.add_argument("--backend", default=os.getenv("VMITRA_EMBED_BACKEND", "st"),
+                    choices=["st", "onnx", "onnx-int8"])
+    ap.add_argument("--out", default=INDEX_DIR, help="index directory")
+    ap.add_argument("--force", action="store_true", help="rebuild even if up to date")
+    args = ap.parse_args(argv)
+
+    model_id = _model_id(args.backend, args.model)
+    key = index_key(args.kb, model_id)
+    if args.command == "info":
+        index = load_index(key, model_id, args.out)
+        state = f"{len(index)} passages" if index is not None else "missing/stale"
+        print(f"key={key[:16]} model={model_id} dir={args.out}: {state}")
+        return 0 if index is not None else 1
+
+    t0 = time.perf_counter()
+    index = load_or_build_index(lambda: _load_model(args.backend, args.model), args.kb,
+                                model_id, args.out, force=args.force)
+    print(f"index ready: {len(index)} passages, key={key[:16]}, "
+          f"{time.perf_counter() - t0:.1f}s -> {_artifact_dir(args.out, key, model_id)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
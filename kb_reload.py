@@ -0,0 +1,106 @@
+"""
+Hot reload of vmitra_knowledge_base.json without restarting the app.
+
+A daemon thread polls the KB file's (mtime, size) every KB_WATCH_INTERVAL
+seconds. On a change it rebuilds the index next to the live one – passages
+are diffed by content hash and only added / edited ones are re-embedded – then
+hands it to ChatEngine.swap_index(), which replaces the (index, lexical) pair
+in one assignment. Requests already in flight finish on the old snapshot;
+cached replies grounded on edited or removed passages are invalidated, and
+pre-generated intent answers are carried over or regenerated (warmset.py).
+
+A KB that does not parse (e.g. caught mid-save) is skipped and retried on the
+next tick; the running index keeps serving.
+"""
+import logging
+import os
+import threading
+import time
+
+from kb_index import INDEX_DIR, diff_passages, load_or_build_index, passage_digest
+from metrics import REGISTRY
+from warmset import refresh_warmset
+
+log = logging.getLogger("vmitra.kb_reload")
+
+KB_WATCH_INTERVAL = float(os.getenv("VMITRA_KB_WATCH", "5"))   # seconds; 0 = off
+SETTLE_SECONDS    = 0.5     # wait for the writer to finish before reading
+
+KB_RELOADS = REGISTRY.counter("vmitra_kb_reloads_total", "KB hot reloads", ("result",))
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class KBWatcher:
+    def __init__(self, engine, kb_path, model_name, index_dir=INDEX_DIR,
+                 interval=KB_WATCH_INTERVAL):
+        self.engine = engine
+        self.kb_path = kb_path
+        self.model_name = model_name
+        self.index_dir = index_dir
+        self.interval = interval
+        self.last_seen = _signature(kb_path)
+        self.last_failed = None
+        self.reloads = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()       # one reload at a time
+        self._thread = threading.Thread(target=self._run, name="kb-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 1)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            sig = _signature(self.kb_path)
+            if sig is None or sig == self.last_seen or sig == self.last_failed:
+                continue
+            time.sleep(SETTLE_SECONDS)
+            if _signature(self.kb_path) != sig:
+                continue            # still being written; look again next tick
+            self.reload(sig)
+
+    def reload(self, sig=None):
+        """Rebuild from the current KB file and swap it in; returns True on success."""
+        sig = sig or _signature(self.kb_path)
+        with self._lock:
+            old = self.engine.index
+            t0 = time.perf_counter()
+            try:
+                new = load_or_build_index(lambda: self.engine.embedder, self.kb_path,
+                                          self.model_name, self.index_dir, previous=old)
+            except ValueError as e:
+                if sig != self.last_failed:
+                    log.warning("KB does not parse (%s); still serving the previous index", e)
+                self.last_failed = sig
+                KB_RELOADS.inc(result="error")
+                return False
+            except Exception:
+                if sig != self.last_failed:
+                    log.exception("KB reload failed; still serving the previous index")
+                self.last_failed = sig
+                KB_RELOADS.inc(result="error")
+                return False
+            added, changed, removed = diff_passages(old.passages, new.passages)
+            known = {passage_digest(p) for p in old.passages}
+            embedded = sum(1 for p in new.passages if passage_digest(p) not in known)
+            self.engine.swap_index(new, stale_pids=changed | removed)
+            if self.engine.warmset is not None:
+                # keep answers whose prompt is unchanged, regenerate the rest
+                refresh_warmset(self.engine, self.kb_path)
+            self.last_seen, self.last_failed = sig, None
+            self.reloads += 1
+            KB_RELOADS.inc(result="ok")
+            log.info("KB reloaded in %.2fs: %d added, %d changed, %d removed, %d re-embedded",
+                     time.perf_counter() - t0, len(added), len(changed), len(removed), embedded)
+            return True
@@ -0,0 +1,78 @@
+"""
+Cheap local language guess for a user message.
+
+    "hi"        Devanagari script
+    "mr"        Marathi – Devanagari or romanized ("app kasa download karu")
+    "hinglish"  Hindi written in Latin script ("app kaise download karein")
+    "en"        any other Latin text ("how do I register", "reward points")
+    "other"     another script (Gujarati, Bengali, Urdu, …)
+
+Script first, then a count of function words that are common in one language
+and rare in the other; a few microseconds per message, no model involved.
+Keyword queries without any function word ("IVRS number") are English: the
+KB and the corpus are, and romanized Hindi nearly always carries a marker.
+"other" gets the full multilingual system prompt.
+"""
+import re
+
+_WORD = re.compile(r"[a-z]+")
+_DEVANAGARI_WORD = re.compile(r"[ऀ-ॣॱ-ॿ]+")
+
+# common romanized-Hindi function words; two hits (or one in a short message)
+# is enough to call it Hinglish
+HINGLISH_MARKERS = frozenset("""
+    kaise kese kya kyu kyon kaha kahan kab kaun kitna kitne kitni hai hain ho hoga
+    karein karen karna karu karun kare kar kiya kijiye mera meri mere mujhe hum
+    humko aap apna apni nahi nahin nhi haan ji bhi aur ya se ko ka ki ke mein
+    par wala wali raha rahi gaya gayi chahiye sakta sakte sakti batao bataye
+    paisa paise milega milta karo karenge karega jodna jodein jodo bharna
+    bharein bharo kholna kholein dekhna dekhein bhejna bhejein badalna badlein
+""".split())
+
+# romanized Marathi; "karu" is shared with Hindi, so Marathi has to out-count
+MARATHI_MARKERS = frozenset("""
+    kasa kasi kase kay kaay ahe aahe ahet aahet mala tumhi tumcha tumchi
+    tumche majha maza mazi maze majhi kuthe kadhi karu karaycha karaychi karaych
+    pahije hoil milel milto zala zhala ani aani kiva kinva sanga karayche
+    jodayche jodaycha bharayche
+""".split())
+
+# Devanagari function words that tell Marathi from Hindi
+MARATHI_DEVANAGARI = frozenset("""
+    आहे आहेत नाही काय कसा कसे कशी कसं मला मी तुम्ही तुमचा तुमची तुमचे माझा माझी
+    माझे कुठे केव्हा कधी करू करायचे करायचा पाहिजे होईल मिळेल मिळतो झाले झाला
+    आणि किंवा सांगा
+""".split())
+HINDI_DEVANAGARI = frozenset("""
+    है हैं क्या कैसे कैसा मैं मुझे मेरा मेरी मेरे नहीं और में का की के करें करूं
+    करूँ कहाँ कहां कब कौन चाहिए सकता सकते रहा गया हूँ हूं बताएं बताइए मिलेगा
+""".split())
+
+
+def _script_shares(text):
+    """(Devanagari, other non-Latin) share of the letters in `text`."""
+    letters = [c for c in text if c.isalpha()]
+    if not letters:
+        return 0.0, 0.0
+    devanagari = sum("ऀ" <= c <= "ॿ" for c in letters)
+    latin = sum(c <= "ɏ" for c in letters)      # Basic Latin to Latin Extended-B
+    return devanagari / len(letters), (len(letters) - devanagari - latin) / len(letters)
+
+
+def detect_language(text):
+    devanagari, foreign = _script_shares(text)
+    if devanagari >= 0.3:
+        words = _DEVANAGARI_WORD.findall(text)
+        mr = sum(w in MARATHI_DEVANAGARI for w in words) + ("ळ" in text)
+        hi = sum(w in HINDI_DEVANAGARI for w in words)
+        return "mr" if mr > hi else "hi"
+    if foreign >= 0.5:
+        return "other"
+    words = _WORD.findall(text.lower())
+    hits = sum(w in HINGLISH_MARKERS for w in words)
+    mr = sum(w in MARATHI_MARKERS for w in words)
+    if mr > hits and (mr >= 2 or len(words) <= 4):
+        return "mr"
+    if hits >= 2 or (hits == 1 and len(words) <= 4):
+        return "hinglish"
+    return "en"
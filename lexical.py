@@ -0,0 +1,270 @@
+"""
+BM25 inverted index with Hindi / Hinglish-aware normalization, fused with the
+dense (MiniLM) ranking by reciprocal rank fusion.
+
+all-MiniLM-L6-v2 is an English model, so for "बैंक अकाउंट कैसे जोड़ें" or
+"inaam kitna milega" the dense argmax is often off. Every word – Latin or
+Devanagari – is reduced to the same rough phonetic form so that the KB's
+English terms, romanized Hinglish and Devanagari spellings meet:
+
+    Devanagari  → romanized (with Hindi schwa deletion): बिजली → bijli
+    fold        → aspirates dropped, vowel digraphs merged, doubles collapsed:
+                  shikaayat / शिकायत → sikayat, account → akont
+    skeleton    → consonants only, indexed as an extra "#" term: "#knt"
+    synonyms    → a small Hindi/Hinglish → English KB vocabulary (inaam → reward)
+
+The index is built once at startup; a query touches only its terms' posting
+arrays, which is well under a millisecond at the KB's size.
+"""
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+import numpy as np
+
+RETRIEVER      = os.getenv("VMITRA_RETRIEVER", "hybrid")      # hybrid | dense
+RRF_K          = 60
+FUSION_DEPTH   = 50        # candidates taken from each ranking
+LEXICAL_WEIGHT = float(os.getenv("VMITRA_LEXICAL_WEIGHT", "1.0"))
+# Hindi / Hinglish / Marathi queries: the dense side is weakest there
+NATIVE_LEXICAL_WEIGHT = float(os.getenv("VMITRA_NATIVE_LEXICAL_WEIGHT", "2.0"))
+BM25_K1        = 1.5
+BM25_B         = 0.75
+
+# ────────────────────────────────
+# Devanagari → Latin
+# ────────────────────────────────
+_CONSONANTS = {
+    "क": "k", "ख": "kh", "ग": "g", "घ": "gh", "ङ": "n", "च": "ch", "छ": "chh",
+    "ज": "j", "झ": "jh", "ञ": "n", "ट": "t", "ठ": "th", "ड": "d", "ढ": "dh",
+    "ण": "n", "त": "t", "थ": "th", "द": "d", "ध": "dh", "न": "n", "प": "p",
+    "फ": "ph", "ब": "b", "भ": "bh", "म": "m", "य": "y", "र": "r", "ल": "l",
+    "ळ": "l", "व": "v", "श": "sh", "ष": "sh", "स": "s", "ह": "h",
+}
+_NUKTA = {"क": "q", "ख": "kh", "ग": "g", "ज": "z", "ड": "r", "ढ": "rh", "फ": "f", "य": "y"}
+_VOWELS = {
+    "अ": "a", "आ": "aa", "इ": "i", "ई": "ee", "उ": "u", "ऊ": "oo", "ऋ": "ri",
+    "ए": "e", "ऐ": "ai", "ओ": "o", "औ": "au", "ऑ": "o", "ऍ": "e",
+}
+_MATRAS = {
+    "ा": "aa", "ि": "i", "ी": "ee", "ु": "u", "ू": "oo", "ृ": "ri", "े": "e",
+    "ै": "ai", "ो": "o", "ौ": "au", "ॉ": "o", "ॅ": "e",
+}
+_VIRAMA, _NUKTA_SIGN = "्", "़"
+_NASALS = {"ं": "n", "ँ": "n"}
+_DIGITS = {chr(0x0966 + i): str(i) for i in range(10)}
+
+
+def transliterate(word):
+    """Romanize one Devanagari word, deleting the inherent 'a' where Hindi drops it."""
+    word = unicodedata.normalize("NFD", word)   # split precomposed nukta letters
+    units = []      # [consonant or "", vowel, vowel_is_inherent, coda]
+    i = 0
+    while i < len(word):
+        ch = word[i]
+        if ch in _CONSONANTS:
+            cons = _CONSONANTS[ch]
+            if i + 1 < len(word) and word[i + 1] == _NUKTA_SIGN:
+                cons = _NUKTA.get(ch, cons)
+                i += 1
+            units.append([cons, "a", True, ""])
+        elif ch in _MATRAS and units:
+            units[-1][1], units[-1][2] = _MATRAS[ch], False
+        elif ch == _VIRAMA and units:
+            units[-1][1], units[-1][2] = "", False
+        elif ch in _VOWELS:
+            units.append(["", _VOWELS[ch], False, ""])
+        elif ch in _NASALS and units:
+            units[-1][3] += _NASALS[ch]
+        elif ch == "ः" and units:
+            units[-1][3] += "h"
+        elif ch in _DIGITS:
+            units.append(["", _DIGITS[ch], False, ""])
+        i += 1
+
+    # schwa deletion: word-final, and a → ∅ / VC_CV
+    for j, u in enumerate(units):
+        if not (u[0] and u[2]) or u[3]:
+            continue
+        if j == len(units) - 1:
+            u[1] = "" if j > 0 else u[1]
+        elif (j > 0 and units[j - 1][1] and units[j + 1][0] and units[j + 1][1]):
+            u[1] = ""
+        u[2] = False
+    return "".join(c + v + coda for c, v, _, coda in units)
+
+
+# ────────────────────────────────
+# Folding
+# ────────────────────────────────
+_FOLD_RULES = [
+    (re.compile(r"x"), "ks"),
+    (re.compile(r"chh|ch"), "č"),         # keep "ch" apart from hard c
+    (re.compile(r"([kgjtdb])h"), r"\1"),   # drop aspiration
+    (re.compile(r"ph"), "f"),
+    (re.compile(r"sh"), "s"),
+    (re.compile(r"ck|c|q"), "k"),
+    (re.compile(r"z"), "j"),
+    (re.compile(r"w"), "v"),
+    (re.compile(r"ee|ii"), "i"),
+    (re.compile(r"oo|uu"), "u"),
+    (re.compile(r"ai|ay|ei"), "e"),
+    (re.compile(r"au|ou|aw"), "o"),
+    (re.compile(r"aa"), "a"),
+    (re.compile(r"(.)\1+"), r"\1"),
+]
+_SKELETON_DROP = re.compile(r"(?<=[aeiou])v(?=[^aeiou]|$)|[aeiouyh]")
+
+
+def fold(word):
+    for pattern, repl in _FOLD_RULES:
+        word = pattern.sub(repl, word)
+    return word
+
+
+def skeleton(folded):
+    """Consonant skeleton; soft g (ge/gi) is heard as j in Hindi spellings."""
+    return _SKELETON_DROP.sub("", re.sub(r"g(?=[ei])", "j", folded))
+
+
+_STOPWORDS_RAW = """
+    a an the is are was were be been am i me my we our you your it its this that
+    to of in on at for from with by and or but if so do does did can could will
+    would should shall may might what which who whom how when where why there
+    here please tell about any some get got have has had not no yes
+    kaise kese kya kyu kyon kaha kahan kab kaun hai hain ho hoga karein karen
+    karna karu karun kare kar kiya kijiye mera meri mere mujhe main mai hum
+    aap apna apni nahi nahin nhi haan ji bhi aur ya se ko ka ki ke mein me par
+    wala wali raha rahi gaya gayi chahiye sakta sakte sakti batao bataye hota
+    kaisa kasa kay ahe aahe mala majha maza kase kasi ahet aahet tumhi tumcha
+    tumchi kuthe kadhi karaycha karaychi pahije ani aani kiva
+"""
+STOPWORDS = frozenset(fold(w) for w in _STOPWORDS_RAW.split())
+
+# Hindi / Hinglish words → the English terms the KB actually uses
+_SYNONYMS_RAW = {
+    "inaam": "reward", "inam": "reward", "puraskar": "reward", "paisa": "reward money",
+    "paise": "reward money", "rashi": "reward amount", "rakam": "amount",
+    "chori": "theft", "bijli": "electricity power", "shikayat": "complaint report",
+    "soochna": "information", "suchna": "information", "jankari": "information",
+    "khata": "account", "panjikaran": "registration register", "darj": "register",
+    "suraksha": "security", "gopniyata": "privacy", "gupt": "anonymous confidential",
+    "pehchan": "identity", "naam": "name", "sthiti": "status", "sthithi": "status",
+    "jodna": "add", "jode": "add", "joden": "add", "jodein": "add", "jorein": "add",
+    "jorna": "add", "dalna": "add enter",
+    "bhar": "load", "kanekshan": "connection", "chhedchhad": "tampering",
+    "chhed": "tampering", "galat": "incorrect wrong", "photo": "photo image",
+    "tasveer": "photo image", "mobail": "mobile", "mobile": "mobile",
+    "sheekayat": "complaint", "apeel": "appeal", "apil": "appeal",
+    "khoj": "search find", "dhundhe": "search find", "dhundhna": "search find",
+    # Marathi
+    "bakshis": "reward", "takrar": "complaint report", "nondani": "registration register",
+    "nondni": "registration register", "vij": "electricity power", "mahiti": "information",
+    "khate": "account", "jodayche": "add", "jodaycha": "add", "jodaayche": "add",
+    "jodaaycha": "add",
+}
+
+
+# ────────────────────────────────
+# Tokenization
+# ────────────────────────────────
+_TOKEN = re.compile(r"[ऀ-ॣ०-ॿ]+|[a-z0-9]+")
+
+
+def _folded_words(text):
+    for w in _TOKEN.findall(unicodedata.normalize("NFC", text.lower())):
+        yield fold(transliterate(w) if "ऀ" <= w[0] <= "ॿ" else w)
+
+
+_SYNONYMS = {fold(k): [fold(t) for t in v.split()] for k, v in _SYNONYMS_RAW.items()}
+
+
+def analyze(text):
+    """Text → index terms: folded words, their skeletons ("#…") and synonyms."""
+    terms = []
+    for w in _folded_words(text):
+        if w in STOPWORDS or len(w) < 2:
+            continue
+        for t in [w] + _SYNONYMS.get(w, []):
+            terms.append(t)
+            sk = skeleton(t)
+            if len(sk) >= 3:
+                terms.append("#" + sk)
+    return terms
+
+
+# ────────────────────────────────
+# BM25 index + fusion
+# ────────────────────────────────
+def _doc_text(p):
+    if p.kind == "qa":
+        return f"{p.text} {p.intent.replace('_', ' ')} {p.answer}"
+    return p.embed_text
+
+
+class LexicalIndex:
+    """
+    Inverted index with BM25 weights folded in at build time: each posting
+    stores idf * tf-saturation, so a query only sums posting arrays.
+    """
+
+    def __init__(self, passages, k1=BM25_K1, b=BM25_B):
+        self.n = len(passages)
+        docs = [Counter(analyze(_doc_text(p))) for p in passages]
+        lengths = np.array([sum(d.values()) for d in docs], dtype=np.float32)
+        avgdl = float(lengths.mean()) if self.n else 1.0
+        df = Counter(t for d in docs for t in d)
+        postings = defaultdict(lambda: ([], []))
+        for i, d in enumerate(docs):
+            norm = k1 * (1 - b + b * lengths[i] / max(avgdl, 1e-9))
+            for t, tf in d.items():
+                idf = math.log(1 + (self.n - df[t] + 0.5) / (df[t] + 0.5))
+                ids, ws = postings[t]
+                ids.append(i)
+                ws.append(idf * tf * (k1 + 1) / (tf + norm))
+        self.postings = {t: (np.array(ids, dtype=np.int32), np.array(ws, dtype=np.float32))
+                         for t, (ids, ws) in postings.items()}
+
+    def scores(self, text):
+        out = np.zeros(self.n, dtype=np.float32)
+        for t in analyze(text):
+            hit = self.postings.get(t)
+            if hit is not None:
+                out[hit[0]] += hit[1]
+        return out
+
+    def search(self, text, k):
+        """Top-k (passage row, BM25 score) pairs with a non-zero score."""
+        s = self.scores(text)
+        return [(int(i), float(s[i])) for i in _ranked(s, k, positive_only=True)]
+
+
+def _ranked(scores, depth, positive_only=False):
+    idx = np.flatnonzero(scores > 0) if positive_only else np.arange(len(scores))
+    if len(idx) > depth:
+        idx = idx[np.argpartition(-scores[idx], depth - 1)[:depth]]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def lexical_weight(lang):
+    """Fusion weight of the BM25 ranking for a query in `lang`."""
+    return LEXICAL_WEIGHT if lang == "en" else NATIVE_LEXICAL_WEIGHT
+
+
+def hybrid_search(index, lexical, qv, text, k, depth=FUSION_DEPTH, rrf_k=RRF_K,
+                  lexical_weight=LEXICAL_WEIGHT):
+    """
+    Reciprocal rank fusion of the dense and BM25 rankings. Results are ordered
+    by the fused score but carry their dense cosine, which the fast path and
+    cache thresholds are calibrated on.
+    """
+    dense = index.scores(qv)
+    fused = defaultdict(float)
+    for rank, i in enumerate(_ranked(dense, depth)):
+        fused[int(i)] += 1.0 / (rrf_k + rank + 1)
+    for rank, i in enumerate(_ranked(lexical.scores(text), depth, positive_only=True)):
+        fused[int(i)] += lexical_weight / (rrf_k + rank + 1)
+    top = sorted(fused, key=fused.__getitem__, reverse=True)[:k]
+    return [(index.passages[i], float(dense[i])) for i in top]
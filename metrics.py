@@ -0,0 +1,283 @@
+"""
+Per-stage timings, counters and structured logs for the chat pipeline.
+
+Every turn records how long each stage took:
+
+    embed       query embedding (incl. micro-batch wait)
+    search      dense / hybrid passage search
+    prompt      prompt assembly
+    groq_ttfb   request sent → first token (streaming) / response headers
+    groq_total  request sent → reply complete
+    render      writing the reply to the UI or SSE client
+
+Stage durations go to the `vmitra_stage_seconds` histogram, so p50/p95/p99 per
+stage come from `histogram_quantile()` in Prometheus. Counters cover turns by
+source, Groq errors and token usage; engine components that already keep
+stats (retries, cache, embed batcher) are read at scrape time.
+
+The text exposition is served by server.py at GET /metrics, and by a tiny
+side server on VMITRA_METRICS_PORT for the Streamlit app.
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOG_FORMAT   = os.getenv("VMITRA_LOG_FORMAT", "text")         # text | json
+METRICS_PORT = int(os.getenv("VMITRA_METRICS_PORT", "0"))     # 0 = no side server
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _fmt(v):
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    esc = (str(v).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+           for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, esc)) + "}"
+
+
+# ────────────────────────────────
+# Metric types
+# ────────────────────────────────
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels.get(n, "")) for n in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _labels(self.labelnames, k), v)
+                    for k, v in sorted(self._values.items())]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=STAGE_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}       # labels → [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            s = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+                    break
+            s[-2] += value
+            s[-1] += 1
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, s in sorted(self._series.items()):
+                cumulative = 0
+                for b, n in zip(self.buckets, s):
+                    cumulative += n
+                    out.append((self.name + "_bucket",
+                                _labels(self.labelnames, key, [("le", _fmt(b))]), cumulative))
+                out.append((self.name + "_sum", _labels(self.labelnames, key), s[-2]))
+                out.append((self.name + "_count", _labels(self.labelnames, key), s[-1]))
+        return out
+
+
+class Callback:
+    """Value(s) read at scrape time: fn() → number, or {label value: number}."""
+
+    def __init__(self, name, help, kind, fn, labelname=None):
+        self.name, self.help, self.kind, self.fn = name, help, kind, fn
+        self.labelname = labelname
+
+    def samples(self):
+        try:
+            v = self.fn()
+        except Exception:
+            return []
+        if self.labelname is None:
+            return [(self.name, "", v)]
+        return [(self.name, _labels((self.labelname,), (k,)), x) for k, x in sorted(v.items())]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_add(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=STAGE_BUCKETS):
+        return self._get_or_add(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name, help, fn, kind="gauge", labelname=None):
+        # re-registering replaces the callback (e.g. a rebuilt engine)
+        with self._lock:
+            self._metrics[name] = Callback(name, help, kind, fn, labelname)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for m in metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(f"{name}{labels} {_fmt(v)}" for name, labels, v in m.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("vmitra_stage_seconds",
+                                   "Time spent per pipeline stage", ("stage",))
+TURNS         = REGISTRY.counter("vmitra_turns_total",
+                                 "Turns answered, by serving path", ("source", "lang"))
+GROQ_ERRORS   = REGISTRY.counter("vmitra_groq_errors_total",
+                                 "Failed Groq calls", ("kind",))
+GROQ_TOKENS   = REGISTRY.counter("vmitra_groq_tokens_total",
+                                 "Tokens billed by Groq (usage field)", ("type",))
+
+
+def observe_stage(name, seconds, timings=None):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name, timings=None):
+    """Time the block as stage `name`; also adds it to the per-turn `timings` dict."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - t0, timings)
+
+
+def record_usage(usage):
+    """Count prompt/completion tokens from a Groq `usage` object."""
+    for kind in ("prompt", "completion"):
+        n = (usage or {}).get(f"{kind}_tokens")
+        if n:
+            GROQ_TOKENS.inc(n, type=kind)
+
+
+def register_engine(engine, registry=REGISTRY):
+    """Expose the engine components' own counters through the registry."""
+    groq = engine.groq
+    registry.callback("vmitra_groq_retries_total", "Groq request retries",
+                      lambda: groq.retries, kind="counter")
+    registry.callback("vmitra_groq_circuit_state", "1 for the breaker's current state",
+                      lambda: {s: int(groq.breaker.state == s)
+                               for s in ("closed", "open", "half_open")},
+                      labelname="state")
+    cache = engine.cache
+    if cache is not None:
+        registry.callback("vmitra_cache_lookups_total", "Semantic cache lookups",
+                          lambda: {"hit": cache.hits, "miss": cache.misses},
+                          kind="counter", labelname="result")
+        registry.callback("vmitra_cache_entries", "Semantic cache entries",
+                          lambda: len(cache.backend))
+    admission = engine.admission
+    if admission is not None:
+        registry.callback("vmitra_llm_in_flight", "Groq calls in flight",
+                          lambda: admission.in_flight)
+        registry.callback("vmitra_admission_queue_depth", "Turns waiting for an LLM slot",
+                          lambda: admission.queued)
+    flights = engine.flights
+    if flights is not None:
+        registry.callback("vmitra_llm_flights", "Distinct LLM calls shared by identical turns",
+                          lambda: len(flights))
+    embedder = engine.embedder
+    if hasattr(embedder, "stats"):
+        registry.callback("vmitra_embed_batches_total", "Embedding forward passes",
+                          lambda: embedder.batches, kind="counter")
+        registry.callback("vmitra_embed_items_total", "Queries embedded via the batcher",
+                          lambda: embedder.items, kind="counter")
+        registry.callback("vmitra_embed_queue_depth", "Queries waiting for the batcher",
+                          lambda: embedder.queue_depth)
+        # batch sizes: the vmitra_embed_batch_size histogram, observed by batcher.py
+
+
+# ────────────────────────────────
+# Structured logs
+# ────────────────────────────────
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra={"fields": {...}}` is merged in."""
+
+    def format(self, record):
+        out = {"ts": round(record.created, 3), "level": record.levelname,
+               "logger": record.name, "msg": record.getMessage()}
+        out.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+def configure_logging(level=logging.INFO, fmt=LOG_FORMAT, logger="vmitra"):
+    """Attach one handler to the `vmitra` loggers (JSON or plain text)."""
+    lg = logging.getLogger(logger)
+    if any(getattr(h, "_vmitra", False) for h in lg.handlers):
+        return lg
+    handler = logging.StreamHandler()
+    handler._vmitra = True
+    handler.setFormatter(JsonFormatter() if fmt == "json"
+                         else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    lg.addHandler(handler)
+    lg.setLevel(level)
+    lg.propagate = False
+    return lg
+
+
+# ────────────────────────────────
+# Side server (Streamlit has no route of its own for /metrics)
+# ────────────────────────────────
+def start_http_server(port=METRICS_PORT, registry=REGISTRY, host="0.0.0.0"):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=httpd.serve_forever, name="metrics", daemon=True).start()
+    return httpd
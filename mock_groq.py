@@ -0,0 +1,158 @@
+"""
+Local stand-in for the Groq chat-completions endpoint, for benchmarks and
+offline runs. Speaks the same protocol GroqClient uses: a JSON body for
+blocking calls, server-sent events for `"stream": true`, and a `usage` object
+in both.
+
+    python mock_groq.py --port 8001 --ttfb-ms 250 --token-ms 12 --tokens 80
+    GROQ_API_URL=http://127.0.0.1:8001/ python server.py
+
+Latency model: `ttfb_ms` before the first byte, then `token_ms` per streamed
+token (blocking calls wait the whole time and answer at once). `error_rate`
+answers that fraction of requests with a 503, which GroqClient retries.
+
+Scripted failures, for tests: the first `fail_first` requests are answered
+with `fail_status` (and a `Retry-After: retry_after` header when set), and
+`break_after` cuts every stream after that many tokens without a final event.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("V-Mitra", "helps", "you", "report", "electricity", "irregularities",
+         "and", "earn", "rewards.", "Open", "the", "app", "and", "tap", "Report.")
+
+
+class MockGroqConfig:
+    def __init__(self, ttfb_ms=250.0, token_ms=10.0, tokens=60, error_rate=0.0, seed=None,
+                 fail_first=0, fail_status=503, retry_after=None, break_after=None):
+        self.ttfb = ttfb_ms / 1000.0
+        self.token = token_ms / 1000.0
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.break_after = break_after
+        self.random = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+
+def _reply_tokens(n):
+    return [(" " if i else "") + WORDS[i % len(WORDS)] for i in range(n)]
+
+
+def _handler(cfg):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, obj, headers=()):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _chunk(self, data):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def do_POST(self):
+            n = int(self.headers.get("Content-Length") or 0)
+            try:
+                payload = json.loads(self.rfile.read(n) or b"{}")
+            except ValueError:
+                self._send_json(400, {"error": {"message": "invalid JSON"}})
+                return
+            if cfg.count() <= cfg.fail_first:
+                headers = [] if cfg.retry_after is None else [("Retry-After", str(cfg.retry_after))]
+                self._send_json(cfg.fail_status, {"error": {"message": "mock failure"}}, headers)
+                return
+            if cfg.error_rate and cfg.random.random() < cfg.error_rate:
+                self._send_json(503, {"error": {"message": "mock overload"}})
+                return
+
+            prompt_tokens = sum(len(str(m.get("content", ""))) // 4
+                                for m in payload.get("messages", []))
+            tokens = _reply_tokens(cfg.tokens)
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                     "total_tokens": prompt_tokens + len(tokens)}
+            time.sleep(cfg.ttfb)
+
+            if not payload.get("stream"):
+                time.sleep(cfg.token * len(tokens))
+                self._send_json(200, {"choices": [{"index": 0, "finish_reason": "stop",
+                                                   "message": {"role": "assistant",
+                                                               "content": "".join(tokens)}}],
+                                      "usage": usage})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for i, tok in enumerate(tokens):
+                    if i == cfg.break_after:
+                        self.close_connection = True
+                        return      # no final event, no terminating chunk
+                    if i:
+                        time.sleep(cfg.token)
+                    event = {"choices": [{"index": 0, "delta": {"content": tok}}]}
+                    self._chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                         "x_groq": {"usage": usage}}
+                self._chunk(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass        # client abandoned the stream
+
+    return Handler
+
+
+def start_mock(host="127.0.0.1", port=0, **config):
+    """Serve in a daemon thread; returns (server, url, config)."""
+    cfg = MockGroqConfig(**config)
+    httpd = ThreadingHTTPServer((host, port), _handler(cfg))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="mock-groq", daemon=True).start()
+    return httpd, f"http://{host}:{httpd.server_port}/", cfg
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Mock Groq chat-completions endpoint")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8001)
+    ap.add_argument("--ttfb-ms", type=float, default=250.0)
+    ap.add_argument("--token-ms", type=float, default=10.0)
+    ap.add_argument("--tokens", type=int, default=60)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    args = ap.parse_args(argv)
+    httpd, url, _ = start_mock(args.host, args.port, ttfb_ms=args.ttfb_ms,
+                               token_ms=args.token_ms, tokens=args.tokens,
+                               error_rate=args.error_rate)
+    print(f"mock Groq listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+System prompt and token-budgeted message assembly for the V-Mitra pipeline.
+
+Message layout (the system prompt is always first and byte-identical per
+language, so the provider can reuse its prefix cache across turns and users):
+
+    system     SYSTEM_PROMPTS[lang], or SYSTEM_PROMPT for other languages
+    system     "Earlier in this conversation: …"   rolling summary of old turns
+    user/asst  the most recent turns, verbatim
+    user       retrieved KB passages (best first) + the new question
+
+    python prompts.py report        token breakdown over the KB intent questions,
+                                    per-language prompts vs the single one
+"""
+import argparse
+import math
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+PROMPT_BUDGET     = int(os.getenv("VMITRA_PROMPT_BUDGET", "3500"))   # input tokens
+RECENT_MESSAGES   = int(os.getenv("VMITRA_RECENT_MESSAGES", "6"))    # kept verbatim
+TOKENIZER_JSON    = os.getenv("VMITRA_TOKENIZER_JSON", "")           # exact counts if set
+CONTEXT_SHARE     = 0.65    # of the free budget that passages may use before history
+SUMMARY_MAX_CHARS = 600
+SUMMARY_LOOKBACK  = 40      # older messages considered for the summary
+MSG_OVERHEAD      = 4       # role/formatting tokens per chat message
+
+SYSTEM_PROMPT = """
+You are V-Mitra ChatBot, the official AI assistant for the V-Mitra citizen audit app by MPEZ. Your role is to help users with anything about V-Mitra: how to use the app, reporting irregularities, understanding rewards, privacy, security, and anything found in the official V-Mitra User Guide or knowledge base.
+
+**Your goals:**
+- Make every answer friendly, human, and natural. It should feel like a helpful person is chatting, not a robot.
+- Use plain, easy language. Prefer short, simple sentences.
+- Always reply in the user’s language. If user messages in Hindi, reply in Hindi. If user uses Hinglish or mixes languages, reply in the same style.  
+- If you’re unsure of the language, reply in both English and the detected Indian language.
+- Strictly answer only about V-Mitra. If a question is unrelated, politely guide the user to rephrase or explain you are only for V-Mitra help.
+- Never fake or make up information. If something isn’t in the guide or knowledge base, say so and suggest where user can get help (like the MPEZ toll-free, official website, or app support).
+- For instructions, use casual step-by-step: “First, open the app…”, “Then, tap…”, “After that…”, “That’s it!”
+- Use real-life examples where possible, especially when the user seems confused.
+- If the user seems frustrated or lost, add empathy: “Don’t worry, this happens a lot”, “I’m here to help you”, etc.
+- When replying, start with a natural intro: “Sure, I can help!”, “Absolutely, here’s what to do…”, “यह आसान है, मैं बताता हूँ…”, etc.
+- Always add practical tips if needed: “Make sure your internet is on…”, “You can also take a photo and upload…”, “If you can’t find your IVRS, tap ‘Find IVRS’ in the app…”
+- Do not use “Summary:” or “Context:” in your output. Instead, weave context naturally into your answers.
+- If the user needs to do something on the app, guide as if talking to a friend over the phone.
+- Avoid technical jargon, unless user asks for it.
+- Always keep the conversation friendly, encouraging, and easy to follow.
+- If user requests information in another language, reply accordingly, and ask them if they prefer English or that language for future responses.
+
+**Sample dialogue styles:**
+- User: "How do I add my bank account for rewards?"
+  Bot: "Great question! You just need to open your V-Mitra app, tap on your profile, and look for 'Add Bank Account.' Fill in your name (like on Aadhaar), your account number, IFSC code, and Aadhaar number. Double check your details so you get your reward directly to your bank!"
+
+- User: "मैं रिपोर्ट कैसे करूँ?"
+  Bot: "बहुत अच्छा सवाल! रिपोर्ट करने के लिए V-Mitra ऐप खोलिए, 'Submit Information' पर टैप करिए, फिर IVRS नंबर डालिए या 'Find IVRS' से ढूंढिए। अब जो भी गड़बड़ी दिख रही है, वो सिलेक्ट करिए, फोटो अपलोड कीजिए, और सबमिट कर दीजिए! कोई दिक्कत हो तो पूछिए!"
+
+- User: "What if I don’t want to share my name?"
+  Bot: "No worries! V-Mitra lets you report issues without showing your name. Just untick the box that says 'I agree to disclose my identity' before submitting your info. Your details will stay private."
+
+- User: "App kasa download karu? (in Marathi)"
+  Bot: "तुम्ही 'V-Mitra' अ‍ॅप Google Play Store किंवा Apple App Store वर शोधू शकता. फक्त 'V-Mitra' टाका, डाउनलोड करा आणि वापरायला सुरू करा!"
+
+
+- User: "App kaise download karein?"  
+  Bot: "आप अपने Android या iPhone पर Play Store या App Store में 'V-Mitra' सर्च करके डाउनलोड कर सकते हैं। बस इंस्टॉल करें, और शुरू करें!"
+
+**Tone:** Always warm, encouraging, never cold. Always help user feel comfortable and confident using V-Mitra.
+
+**Language:** Match user’s language. If Hindi, reply fully in Hindi (very simple words, avoid technical terms). If English, reply in easy English. If Hinglish or other, reply in same. If any other Indian language, reply in that language. If unsure, reply in both English and the detected language.
+
+**If asked something outside V-Mitra domain:**  
+"Sorry, I can only help with V-Mitra app related queries. For other electricity complaints, please call 1912 or visit the official MPEZ website."
+
+**Never say:** “I am an AI language model.” Just answer as a helpful human assistant would.
+
+**If user seems stuck/confused:**  
+"It's okay, take your time! If you have trouble, let me know which step, and I’ll guide you with extra detail
+Or you can Contact direct to our 
+Contact Us
+Block No. 7, Shakti Bhawan
+PO: Vidyut Nagar, Rampur
+Jabalpur (M.P.) India 
+Phone: 1800-233-1266
+Email: mpez.nidaan@gmail.com"
+
+**Always finish with:**  
+"If you need more help, just ask!" (in same language as user)
+
+---
+**[End of system prompt]**
+"""
+
+# Compact per-language system prompts, picked by lang.detect_language: the
+# rules once, then only the reply language, sign-off and one sample dialogue.
+# SYSTEM_PROMPT above stays the fallback for "other" (a script other than
+# Latin or Devanagari) – it replies in whatever the user wrote.
+_PROMPT_CORE = """
+You are V-Mitra ChatBot, the official assistant for the V-Mitra citizen audit app by MPEZ. Help users use the app, report irregularities, and understand rewards, privacy and security.
+
+- Answer only from the knowledge base passages given with the question. Never make things up; if the answer is not there, say so and point to MPEZ support: toll-free 1800-233-1266, mpez.nidaan@gmail.com.
+- Only help with V-Mitra. For anything else say so politely; for other electricity complaints suggest calling 1912 or the MPEZ website.
+- Sound like a friendly person on the phone: short, simple sentences, no jargon, no "Summary:" or "Context:" labels. Never say you are an AI.
+- For app tasks give casual steps ("First, open the app…", "Then, tap…", "That's it!"), add a practical tip when useful, and some empathy if the user seems stuck.
+"""
+
+SYSTEM_PROMPTS = {
+    "en": _PROMPT_CORE + """- Reply in easy English. End with: "If you need more help, just ask!"
+
+Example:
+User: "What if I don't want to share my name?"
+Bot: "No worries! V-Mitra lets you report issues without showing your name. Just untick 'I agree to disclose my identity' before submitting. Your details stay private. If you need more help, just ask!"
+""",
+    "hi": _PROMPT_CORE + """- Reply fully in very simple Hindi, in Devanagari script. End with: "और मदद चाहिए तो बस पूछिए!"
+
+Example:
+User: "मैं रिपोर्ट कैसे करूँ?"
+Bot: "बहुत अच्छा सवाल! V-Mitra ऐप खोलिए, 'Submit Information' पर टैप करिए, फिर IVRS नंबर डालिए या 'Find IVRS' से ढूंढिए। गड़बड़ी चुनिए, फोटो अपलोड कीजिए और सबमिट कर दीजिए! और मदद चाहिए तो बस पूछिए!"
+""",
+    "hinglish": _PROMPT_CORE + """- Reply in Hinglish: simple Hindi written in Roman script, the way people type it on WhatsApp. End with: "Aur madad chahiye to bas poochiye!"
+
+Example:
+User: "App kaise download karein?"
+Bot: "Bahut aasaan hai! Apne Android ya iPhone par Play Store ya App Store kholiye, 'V-Mitra' search kijiye aur install kar dijiye. Aur madad chahiye to bas poochiye!"
+""",
+    "mr": _PROMPT_CORE + """- Reply fully in simple Marathi, in Devanagari script. End with: "आणखी मदत हवी असल्यास नक्की विचारा!"
+
+Example:
+User: "App kasa download karu?"
+Bot: "तुम्ही 'V-Mitra' अ‍ॅप Google Play Store किंवा Apple App Store वर शोधू शकता. फक्त 'V-Mitra' टाका, डाउनलोड करा आणि वापरायला सुरू करा! आणखी मदत हवी असल्यास नक्की विचारा!"
+""",
+}
+LANG_PROMPTS = os.getenv("VMITRA_LANG_PROMPTS", "1") != "0"   # 0 → SYSTEM_PROMPT for all
+
+
+# ────────────────────────────────
+# Token counting
+# ────────────────────────────────
+@lru_cache(maxsize=1)
+def _tokenizer():
+    if not TOKENIZER_JSON:
+        return None
+    from tokenizers import Tokenizer
+    return Tokenizer.from_file(TOKENIZER_JSON)
+
+
+def count_tokens(text):
+    """
+    Exact count when VMITRA_TOKENIZER_JSON points at the LLM's tokenizer.json,
+    otherwise an estimate: ~4 ASCII chars per token, ~1.5 chars per token for
+    Devanagari and other non-ASCII text.
+    """
+    tok = _tokenizer()
+    if tok is not None:
+        return len(tok.encode(text, add_special_tokens=False).ids)
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) / 1.5)
+
+
+# ────────────────────────────────
+# Prompt builder
+# ────────────────────────────────
+QUESTION_TEMPLATE = "Knowledge base passages:\n{context}\n\nUser: {question}\nAnswer:"
+SUMMARY_HEADER    = "Earlier in this conversation (summary):"
+
+
+@dataclass
+class Prompt:
+    messages: list
+    tokens: dict                            # per part + "total"
+    passages: list = field(default_factory=list)   # pids that made it in
+    history_kept: int = 0                   # verbatim messages included
+    history_summarized: int = 0             # older messages folded into the summary
+
+
+def _role(role):
+    return "user" if role == "user" else "assistant"
+
+
+def _first_sentence(text, limit):
+    text = " ".join(text.split())
+    for stop in (". ", "? ", "! ", "। "):
+        i = text.find(stop)
+        if 0 < i < limit:
+            return text[:i + 1]
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def summarize_turns(turns, max_chars=SUMMARY_MAX_CHARS):
+    """
+    Extractive rolling summary of (role, text) turns: the gist of each older
+    message, newest kept first when space runs out. No LLM call involved.
+    """
+    lines, size = [], 0
+    for role, text in reversed(turns):
+        gist = _first_sentence(text, 140 if role == "user" else 160)
+        line = f"- User asked: {gist}" if role == "user" else f"- You answered: {gist}"
+        if size + len(line) + 1 > max_chars:
+            break
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(reversed(lines))
+
+
+class PromptBuilder:
+    def __init__(self, system_prompt=SYSTEM_PROMPT, budget=PROMPT_BUDGET,
+                 recent_messages=RECENT_MESSAGES,
+                 system_prompts=SYSTEM_PROMPTS if LANG_PROMPTS else None):
+        self.system_prompt = system_prompt
+        self.budget = budget
+        self.recent_messages = recent_messages
+        self.system_tokens = count_tokens(system_prompt) + MSG_OVERHEAD
+        # lang → (prompt, tokens); other languages get system_prompt
+        self.system_prompts = {lang: (text, count_tokens(text) + MSG_OVERHEAD)
+                               for lang, text in (system_prompts or {}).items()}
+
+    def system_for(self, lang=None):
+        """(system prompt, its tokens) for `lang`; the full prompt when it has no own one."""
+        return self.system_prompts.get(lang, (self.system_prompt, self.system_tokens))
+
+    def build(self, hits, question, history=(), lang=None):
+        """
+        hits: [(Passage, score)] best first; history: [(role, text)] oldest
+        first, *without* the current question; lang: the question's language
+        as detected by lang.detect_language.
+        """
+        system, system_tokens = self.system_for(lang)
+        # the greeting and anything before the first user message is UI chrome
+        history = list(history)
+        while history and history[0][0] != "user":
+            history.pop(0)
+
+        q_tokens = count_tokens(QUESTION_TEMPLATE.format(context="", question=question)) + MSG_OVERHEAD
+        free = self.budget - system_tokens - q_tokens
+
+        # 1) passages by relevance, up to CONTEXT_SHARE of what is left
+        blocks, pids, ctx_tokens = [], [], 0
+        ctx_cap = max(0, int(free * CONTEXT_SHARE)) if history else max(0, free)
+        for p, _ in hits:
+            block = f"[{len(blocks) + 1}] {p.render()}"
+            t = count_tokens(block) + 1
+            if ctx_tokens + t > ctx_cap:
+                continue            # a shorter, lower-ranked passage may still fit
+            blocks.append(block)
+            pids.append(p.pid)
+            ctx_tokens += t
+        free -= ctx_tokens
+
+        # 2) most recent turns verbatim, newest first until budget/window runs out
+        recent, hist_tokens = [], 0
+        for role, text in reversed(history[-self.recent_messages:] if self.recent_messages else []):
+            t = count_tokens(text) + MSG_OVERHEAD
+            if hist_tokens + t > free:
+                break
+            recent.append({"role": _role(role), "content": text})
+            hist_tokens += t
+        recent.reverse()
+        free -= hist_tokens
+
+        # 3) everything older is folded into a short rolling summary
+        older = history[:len(history) - len(recent)][-SUMMARY_LOOKBACK:]
+        summary, sum_tokens = "", 0
+        if older and free > MSG_OVERHEAD + 16:
+            max_chars = min(SUMMARY_MAX_CHARS, (free - MSG_OVERHEAD) * 3)
+            body = summarize_turns(older, max_chars)
+            if body:
+                summary = f"{SUMMARY_HEADER}\n{body}"
+                sum_tokens = count_tokens(summary) + MSG_OVERHEAD
+
+        messages = [{"role": "system", "content": system}]
+        if summary:
+            messages.append({"role": "system", "content": summary})
+        messages.extend(recent)
+        messages.append({"role": "user", "content":
+                         QUESTION_TEMPLATE.format(context="\n\n".join(blocks), question=question)})
+
+        tokens = {"system": system_tokens, "summary": sum_tokens,
+                  "history": hist_tokens, "context": ctx_tokens, "question": q_tokens}
+        tokens["total"] = sum(tokens.values())
+        return Prompt(messages, tokens, pids, len(recent), len(older))
+
+
+# ────────────────────────────────
+# Prompt-size report
+# ────────────────────────────────
+def prompt_size_report(builder=None, top_k=4, lang=None):
+    """
+    Build the prompt for every KB intent question, using the lexically
+    closest passages as a stand-in for retrieval (no embedder needed), and
+    summarize the token cost per part. `lang` picks the system prompt the
+    questions are built with, as if they had been asked in that language.
+    """
+    from kb_index import iter_passages, load_kb
+
+    builder = builder or PromptBuilder()
+    passages = iter_passages(load_kb())
+    words = [set(p.embed_text.lower().split()) for p in passages]
+    rows = []
+    for p in passages:
+        if p.kind != "qa":
+            continue
+        q = set(p.text.lower().split())
+        ranked = sorted(range(len(passages)), key=lambda i: -len(q & words[i]))[:top_k]
+        rows.append(builder.build([(passages[i], 0.0) for i in ranked], p.text,
+                                  lang=lang).tokens)
+    parts = list(rows[0]) if rows else []
+    return {part: {"mean": sum(r[part] for r in rows) / len(rows),
+                   "max": max(r[part] for r in rows)} for part in parts}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Prompt token report")
+    ap.add_argument("command", choices=["report"])
+    ap.add_argument("--budget", type=int, default=PROMPT_BUDGET)
+    args = ap.parse_args(argv)
+    single = prompt_size_report(PromptBuilder(budget=args.budget, system_prompts=None))
+    print(f"{'part':>10} {'mean':>8} {'max':>6}   (single SYSTEM_PROMPT)")
+    for part, v in single.items():
+        print(f"{part:>10} {v['mean']:>8.1f} {v['max']:>6}")
+
+    # same questions with each language's compact prompt: what a turn saves
+    builder = PromptBuilder(budget=args.budget, system_prompts=SYSTEM_PROMPTS)
+    base = single["total"]["mean"]
+    print(f"\n{'lang':>10} {'system':>8} {'total':>8} {'saved':>6} {'saved %':>8}")
+    for lang in SYSTEM_PROMPTS:
+        report = prompt_size_report(builder, lang=lang)
+        total = report["total"]["mean"]
+        print(f"{lang:>10} {report['system']['mean']:>8.1f} {total:>8.1f} "
+              f"{base - total:>6.0f} {100 * (base - total) / base:>7.1f}%")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,224 @@
+"""
+Semantic response cache.
+
+A reply is reused when a new query is close enough (cosine >= threshold) to a
+past query that retrieved the *same* KB passages in the *same* language. The
+(language, passage ids) pair forms a bucket, so a lookup only compares the
+query vector against the few entries of its own bucket. Entries also remember
+their passage ids, so a KB reload can drop the replies built on edited text.
+
+Backends:
+    MemoryBackend   per-process OrderedDict (LRU + TTL)
+    SQLiteBackend   one local file shared by every Streamlit worker on the node
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_BACKEND   = os.getenv("VMITRA_CACHE", "memory")           # memory | sqlite | off
+CACHE_PATH      = os.getenv("VMITRA_CACHE_PATH", ".vmitra_cache.sqlite3")
+CACHE_THRESHOLD = float(os.getenv("VMITRA_CACHE_THRESHOLD", "0.92"))
+CACHE_TTL       = float(os.getenv("VMITRA_CACHE_TTL", str(24 * 3600)))
+CACHE_MAX       = int(os.getenv("VMITRA_CACHE_MAX", "2000"))
+
+
+def bucket_key(lang, context_ids):
+    """Same language + same set of retrieved passages."""
+    raw = lang + "|" + "|".join(sorted(context_ids))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    def __init__(self, max_entries=CACHE_MAX, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()       # id -> (bucket, vec, reply, created, passages)
+        self._buckets = {}                  # bucket -> set(ids)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, eid):
+        bucket = self._entries.pop(eid)[0]
+        ids = self._buckets.get(bucket)
+        if ids is not None:
+            ids.discard(eid)
+            if not ids:
+                del self._buckets[bucket]
+
+    def get(self, bucket, qv, threshold):
+        now = time.time()
+        with self._lock:
+            ids = list(self._buckets.get(bucket, ()))
+            best, best_sim = None, threshold
+            for eid in ids:
+                _, vec, _, created, _ = self._entries[eid]
+                if now - created > self.ttl:
+                    self._drop(eid)
+                    continue
+                sim = float(vec @ qv)
+                if sim >= best_sim:
+                    best, best_sim = eid, sim
+            if best is None:
+                return None
+            self._entries.move_to_end(best)
+            return self._entries[best][2]
+
+    def put(self, bucket, qv, query, reply, passages=()):
+        with self._lock:
+            eid = self._next_id
+            self._next_id += 1
+            self._entries[eid] = (bucket, np.asarray(qv, dtype=np.float32).copy(),
+                                  reply, time.time(), frozenset(passages))
+            self._buckets.setdefault(bucket, set()).add(eid)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, pids):
+        """Drop entries built on any of `pids`; returns how many were removed."""
+        pids = set(pids)
+        with self._lock:
+            stale = [eid for eid, e in self._entries.items() if e[4] & pids]
+            for eid in stale:
+                self._drop(eid)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """Shared on-disk cache; WAL mode lets several processes read while one writes."""
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                id        INTEGER PRIMARY KEY,
+                bucket    TEXT NOT NULL,
+                vec       BLOB NOT NULL,
+                query     TEXT NOT NULL,
+                reply     TEXT NOT NULL,
+                created   REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS response_cache_bucket ON response_cache(bucket);
+            CREATE INDEX IF NOT EXISTS response_cache_used   ON response_cache(last_used);
+        """)
+        cols = {r[1] for r in self._db.execute("PRAGMA table_info(response_cache)")}
+        if "passages" not in cols:
+            # "|pid|pid|" so one passage can be matched with instr()
+            self._db.execute("ALTER TABLE response_cache"
+                             " ADD COLUMN passages TEXT NOT NULL DEFAULT ''")
+
+    def get(self, bucket, qv, threshold):
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, vec, reply FROM response_cache WHERE bucket=? AND created>?",
+                (bucket, now - self.ttl)).fetchall()
+            if not rows:
+                return None
+            vecs = np.stack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+            sims = vecs @ qv
+            i = int(np.argmax(sims))
+            if sims[i] < threshold:
+                return None
+            self._db.execute("UPDATE response_cache SET last_used=? WHERE id=?",
+                             (now, rows[i][0]))
+            return rows[i][2]
+
+    def put(self, bucket, qv, query, reply, passages=()):
+        now = time.time()
+        vec = np.asarray(qv, dtype=np.float32).tobytes()
+        tags = "|" + "|".join(passages) + "|" if passages else ""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT INTO response_cache(bucket, vec, query, reply, created, last_used,"
+                    " passages) VALUES (?,?,?,?,?,?,?)",
+                    (bucket, vec, query, reply, now, now, tags))
+                self._db.execute("DELETE FROM response_cache WHERE created<=?",
+                                 (now - self.ttl,))
+                # LRU: keep only the most recently used max_entries rows
+                self._db.execute(
+                    "DELETE FROM response_cache WHERE id IN (SELECT id FROM response_cache"
+                    " ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def invalidate(self, pids):
+        """Drop rows built on any of `pids` (and untagged legacy rows)."""
+        with self._lock:
+            removed = self._db.execute("DELETE FROM response_cache WHERE passages=''").rowcount
+            for pid in pids:
+                removed += self._db.execute(
+                    "DELETE FROM response_cache WHERE instr(passages, ?) > 0",
+                    (f"|{pid}|",)).rowcount
+            return removed
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM response_cache")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class SemanticCache:
+    def __init__(self, backend, threshold=CACHE_THRESHOLD):
+        self.backend = backend
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, qv, context_ids, lang):
+        reply = self.backend.get(bucket_key(lang, context_ids), qv, self.threshold)
+        if reply is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return reply
+
+    def store(self, qv, context_ids, lang, query, reply):
+        self.backend.put(bucket_key(lang, context_ids), qv, query, reply, context_ids)
+
+    def invalidate(self, pids):
+        """Forget replies that were grounded on any of these passages."""
+        return self.backend.invalidate(pids) if pids else 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self.backend)}
+
+
+def make_cache(kind=CACHE_BACKEND):
+    """Cache configured from VMITRA_CACHE*; None when caching is off."""
+    if kind == "off":
+        return None
+    if kind == "sqlite":
+        return SemanticCache(SQLiteBackend())
+    if kind == "memory":
+        return SemanticCache(MemoryBackend())
+    raise ValueError(f"unknown cache backend: {kind!r}")
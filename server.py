@@ -0,0 +1,206 @@
+"""
+Headless HTTP API for the V-Mitra chat engine (WhatsApp bridge, in-app help …).
+
+    POST /chat          {"message": "...", "history": [{"role", "content"}, …]}
+                        → {"reply", "source", "passages", "lang", "prompt_tokens"}
+    POST /chat/stream   same body → text/event-stream of
+                            data: {"delta": "..."}
+                            data: {"done": true, "reply": ..., "source": ...}
+    GET  /healthz
+    GET  /metrics       Prometheus text format (per-stage latency, counters)
+
+All conversations share one asyncio event loop. Query embedding (CPU bound)
+runs on a small thread pool sized to the cores; the blocking Groq calls run on
+a larger I/O pool so slow upstream replies never stall the loop.
+
+LLM calls go through the engine's admission control, keyed by client IP.
+With VMITRA_ADMISSION_OVERFLOW=reject a turned-away turn is answered with
+429 (per-client limit) or 503 (server busy) and a Retry-After header; on
+the stream it arrives as a final {"error": ..., "retry_after": ...} event.
+
+    python server.py --port 8080
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+from admission import ADMISSION_QUEUE, MAX_IN_FLIGHT, AdmissionDenied
+from engine import TurnCancelled, build_engine
+from metrics import CONTENT_TYPE, REGISTRY, configure_logging, observe_stage
+
+log = logging.getLogger("vmitra.server")
+
+EMBED_WORKERS = int(os.getenv("VMITRA_EMBED_WORKERS", str(os.cpu_count() or 2)))
+# enough threads for every admitted call plus every queued one
+IO_WORKERS    = int(os.getenv("VMITRA_IO_WORKERS", str(max(64, MAX_IN_FLIGHT + ADMISSION_QUEUE))))
+MAX_MESSAGE   = 2000    # characters
+MAX_HISTORY   = 50      # messages; older ones only feed the rolling summary anyway
+
+ENGINE    = web.AppKey("engine", object)
+CPU_POOL  = web.AppKey("cpu_pool", ThreadPoolExecutor)
+IO_POOL   = web.AppKey("io_pool", ThreadPoolExecutor)
+
+
+def _turn_json(turn):
+    return {"reply": turn.reply, "source": turn.source, "lang": turn.retrieval.lang,
+            "passages": turn.retrieval.ctx_ids, "prompt_tokens": turn.prompt_tokens}
+
+
+async def _read_message(request):
+    """(message, history) from the JSON body; history is optional."""
+    try:
+        body = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise web.HTTPBadRequest(text="body must be JSON")
+    message = body.get("message") if isinstance(body, dict) else None
+    if not isinstance(message, str) or not message.strip():
+        raise web.HTTPBadRequest(text="'message' is required")
+    if len(message) > MAX_MESSAGE:
+        raise web.HTTPRequestEntityTooLarge(max_size=MAX_MESSAGE, actual_size=len(message))
+    items = body.get("history")
+    if items is None:
+        items = []
+    elif not isinstance(items, list):
+        raise web.HTTPBadRequest(text="'history' must be a list")
+    history = []
+    for item in items:
+        if (not isinstance(item, dict) or item.get("role") not in ("user", "assistant")
+                or not isinstance(item.get("content"), str)):
+            raise web.HTTPBadRequest(text="history items need role user|assistant and content")
+        history.append(("user" if item["role"] == "user" else "bot",
+                        item["content"][:MAX_MESSAGE]))
+    return message.strip(), history[-MAX_HISTORY:]
+
+
+async def _retrieve(app, message):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(app[CPU_POOL], app[ENGINE].retrieve, message)
+
+
+def _denied(e):
+    status = web.HTTPTooManyRequests if e.reason == "rate_limited" else web.HTTPServiceUnavailable
+    return status(text=json.dumps({"error": e.reason}), content_type="application/json",
+                  headers={"Retry-After": str(max(1, round(e.retry_after or 1)))})
+
+
+async def chat(request):
+    app = request.app
+    message, history = await _read_message(request)
+    retrieval = await _retrieve(app, message)
+    loop = asyncio.get_running_loop()
+    try:
+        turn = await loop.run_in_executor(app[IO_POOL], app[ENGINE].generate, retrieval,
+                                          None, history, request.remote)
+    except AdmissionDenied as e:
+        raise _denied(e)
+    return web.json_response(_turn_json(turn))
+
+
+async def _send_event(resp, obj):
+    await resp.write(f"data: {json.dumps(obj, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+
+async def chat_stream(request):
+    app = request.app
+    message, history = await _read_message(request)
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def on_delta(delta):
+        # runs on the I/O pool thread; hand the chunk to the event loop
+        if cancelled.is_set():
+            raise TurnCancelled()
+        loop.call_soon_threadsafe(queue.put_nowait, delta)
+
+    resp = web.StreamResponse(headers={"Content-Type": "text/event-stream",
+                                       "Cache-Control": "no-cache",
+                                       "X-Accel-Buffering": "no"})
+    await resp.prepare(request)
+    try:
+        retrieval = await _retrieve(app, message)
+        fut = loop.run_in_executor(app[IO_POOL], app[ENGINE].generate, retrieval,
+                                   on_delta, history, request.remote)
+        # deltas are queued before the future resolves, so None always comes last
+        fut.add_done_callback(lambda _: queue.put_nowait(None))
+        render = 0.0
+        while (delta := await queue.get()) is not None:
+            t0 = time.perf_counter()
+            await _send_event(resp, {"delta": delta})
+            render += time.perf_counter() - t0
+        try:
+            turn = await fut
+        except AdmissionDenied as e:
+            await _send_event(resp, {"error": e.reason, "retry_after": e.retry_after})
+            await resp.write_eof()
+            return resp
+        t0 = time.perf_counter()
+        await _send_event(resp, {"done": True, **_turn_json(turn)})
+        observe_stage("render", render + time.perf_counter() - t0, retrieval.timings)
+    except (asyncio.CancelledError, ConnectionResetError):
+        # client went away: stop the upstream stream at its next chunk
+        cancelled.set()
+        raise
+    await resp.write_eof()
+    return resp
+
+
+async def healthz(request):
+    engine = request.app[ENGINE]
+    body = {"ok": True, "groq": engine.groq.breaker.state}
+    if hasattr(engine.embedder, "stats"):
+        body["embed_batcher"] = {k: v for k, v in engine.embedder.stats().items()
+                                 if k != "batch_size_hist"}
+    if engine.admission is not None:
+        body["admission"] = engine.admission.stats()
+    return web.json_response(body)
+
+
+async def metrics(request):
+    return web.Response(body=REGISTRY.render().encode("utf-8"),
+                        headers={"Content-Type": CONTENT_TYPE})
+
+
+async def _shutdown(app):
+    app[CPU_POOL].shutdown(wait=False, cancel_futures=True)
+    app[IO_POOL].shutdown(wait=False, cancel_futures=True)
+
+
+def make_app(engine):
+    app = web.Application(client_max_size=64 * 1024)
+    app[ENGINE] = engine
+    app[CPU_POOL] = ThreadPoolExecutor(EMBED_WORKERS, thread_name_prefix="embed")
+    app[IO_POOL] = ThreadPoolExecutor(IO_WORKERS, thread_name_prefix="groq")
+    app.router.add_post("/chat", chat)
+    app.router.add_post("/chat/stream", chat_stream)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/metrics", metrics)
+    app.on_cleanup.append(_shutdown)
+    return app
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="V-Mitra chat API")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8080)
+    args = ap.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    configure_logging()     # VMITRA_LOG_FORMAT=json for one JSON object per line
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise SystemExit("❌ Please set the GROQ_API_KEY in your .env")
+    web.run_app(make_app(build_engine(api_key)), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Shared fixtures: a local mock Groq endpoint and a ChatEngine over the real KB.
+
+The engine uses a small bag-of-words embedder instead of MiniLM, so the tests
+run without torch; retrieval quality is not what is under test here.
+"""
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from engine import ChatEngine                      # noqa: E402
+from groq_client import CircuitBreaker, GroqClient  # noqa: E402
+from kb_index import KB_PATH, build_index, load_kb  # noqa: E402
+from lexical import LexicalIndex                   # noqa: E402
+from mock_groq import start_mock                   # noqa: E402
+from response_cache import MemoryBackend, SemanticCache  # noqa: E402
+
+KB_FILE = os.path.join(ROOT, KB_PATH)
+
+
+class HashEmbedder:
+    """Hashed bag of words; same interface as SentenceTransformer.encode."""
+    model_id = "test-hash"
+
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, **kwargs):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                out[i, zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+            out[i, 0] += 0.01
+        return out
+
+
+@pytest.fixture
+def mock_groq():
+    """start(**config) → (url, config); every server is shut down afterwards."""
+    servers = []
+
+    def start(**config):
+        config.setdefault("ttfb_ms", 0)
+        config.setdefault("token_ms", 0)
+        httpd, url, cfg = start_mock(**config)
+        servers.append(httpd)
+        return url, cfg
+
+    yield start
+    for httpd in servers:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+@pytest.fixture(scope="session")
+def kb_index():
+    return build_index(HashEmbedder(), load_kb(KB_FILE))
+
+
+@pytest.fixture
+def make_engine(kb_index):
+    """make_engine(url, **ChatEngine kwargs) with a memory cache and hybrid retrieval."""
+    clients = []
+
+    def make(url, cache=True, **kwargs):
+        groq = GroqClient("test", url, max_retries=0, sleep=lambda s: None,
+                          breaker=CircuitBreaker(failure_threshold=100))
+        clients.append(groq)
+        return ChatEngine(HashEmbedder(), kb_index, groq,
+                          cache=SemanticCache(MemoryBackend()) if cache else None,
+                          lexical=LexicalIndex(kb_index.passages), **kwargs)
+
+    yield make
+    for groq in clients:
+        groq.close()
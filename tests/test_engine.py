@@ -0,0 +1,204 @@
+import json
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionDenied
+from coalesce import SingleFlight
+from engine import TurnCancelled
+from kb_reload import KBWatcher
+
+from conftest import KB_FILE
+
+QUESTION = "Tell me about the app privacy and how my data is stored"
+OTHER_QUESTION = "What happens after I send a report about a meter problem"
+
+
+def _in_threads(*fns):
+    threads = [threading.Thread(target=fn) for fn in fns]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=30)
+
+
+def test_llm_turn_streams_and_is_cached(mock_groq, make_engine):
+    url, cfg = mock_groq(tokens=8)
+    engine = make_engine(url)
+    deltas = []
+    turn = engine.respond(QUESTION, on_delta=deltas.append)
+    assert turn.source == "llm"
+    assert "".join(deltas).strip() == turn.reply
+    assert engine.respond(QUESTION).source == "cache"
+    assert cfg.requests == 1
+
+
+def test_history_turns_do_not_share_the_cache(mock_groq, make_engine):
+    url, cfg = mock_groq(tokens=8)
+    engine = make_engine(url)
+    history = [("user", "My name is Ramesh, IVRS 123"), ("bot", "Hi Ramesh!")]
+    assert engine.respond(QUESTION, history=history).source == "llm"
+    assert engine.respond(QUESTION).source == "llm"        # nothing was stored
+    assert engine.respond(QUESTION, history=history).source == "llm"
+    assert cfg.requests == 3
+
+
+def test_identical_turns_share_one_call(mock_groq, make_engine):
+    url, cfg = mock_groq(ttfb_ms=200, token_ms=10, tokens=20)
+    engine = make_engine(url, cache=False, flights=SingleFlight())
+    turns, deltas = {}, {"stream": []}
+
+    def blocking():
+        turns["blocking"] = engine.respond(QUESTION)
+
+    def streaming():
+        time.sleep(0.05)
+        turns["stream"] = engine.respond(QUESTION, on_delta=deltas["stream"].append)
+
+    _in_threads(blocking, streaming)
+    assert cfg.requests == 1
+    assert turns["stream"].shared and not turns["blocking"].shared
+    # a streaming follower of a blocking leader still gets every delta
+    assert "".join(deltas["stream"]).strip() == turns["stream"].reply == turns["blocking"].reply
+
+
+def test_follower_survives_leader_cancel(mock_groq, make_engine):
+    url, cfg = mock_groq(ttfb_ms=100, token_ms=10, tokens=20)
+    engine = make_engine(url, cache=False, flights=SingleFlight())
+    result = {}
+
+    def leader():
+        seen = []
+
+        def on_delta(delta):
+            seen.append(delta)
+            if len(seen) == 3:
+                raise TurnCancelled()
+        with pytest.raises(TurnCancelled):
+            engine.respond(QUESTION, on_delta=on_delta)
+
+    def follower():
+        time.sleep(0.03)
+        result["turn"] = engine.respond(QUESTION, on_delta=lambda d: None)
+
+    _in_threads(leader, follower)
+    assert result["turn"].source == "llm" and result["turn"].shared
+    assert cfg.requests == 1
+    assert len(engine.flights) == 0
+
+
+def test_abandoned_flight_is_dropped(mock_groq, make_engine):
+    url, _ = mock_groq(ttfb_ms=50, token_ms=20, tokens=50)
+    engine = make_engine(url, cache=False, flights=SingleFlight())
+
+    def cancel(delta):
+        raise TurnCancelled()
+    with pytest.raises(TurnCancelled):
+        engine.respond(QUESTION, on_delta=cancel)
+    assert len(engine.flights) == 0
+
+
+def test_rate_limited_client_gets_kb_reply(mock_groq, make_engine):
+    url, cfg = mock_groq(tokens=5)
+    engine = make_engine(url, cache=False,
+                         admission=AdmissionController(client_rpm=1, client_burst=1))
+    assert engine.respond(QUESTION, client="a").source == "llm"
+    assert engine.respond(OTHER_QUESTION, client="a").source == "kb_fallback"
+    assert engine.respond(OTHER_QUESTION, client="b").source == "llm"
+    assert cfg.requests == 2
+    assert engine.admission.in_flight == 0
+
+
+def test_reject_mode_raises(mock_groq, make_engine):
+    url, _ = mock_groq(tokens=5)
+    engine = make_engine(url, cache=False, admission=AdmissionController(
+        client_rpm=1, client_burst=1, overflow="reject"))
+    engine.respond(QUESTION, client="a")
+    with pytest.raises(AdmissionDenied) as e:
+        engine.respond(OTHER_QUESTION, client="a")
+    assert e.value.reason == "rate_limited" and e.value.retry_after > 0
+
+
+def test_leaders_denial_is_not_shared(mock_groq, make_engine):
+    url, cfg = mock_groq(ttfb_ms=100, tokens=5)
+    admission = AdmissionController()
+    engine = make_engine(url, cache=False, flights=SingleFlight(), admission=admission)
+    acquire, calls = admission.acquire, []
+
+    def acquire_once(client=None):
+        time.sleep(0.1)             # let the follower join before the denial
+        calls.append(client)
+        if len(calls) == 1:
+            raise AdmissionDenied("timeout", retry_after=1.0)
+        acquire(client)
+    admission.acquire = acquire_once
+    turns = {}
+
+    def leader():
+        turns["leader"] = engine.respond(QUESTION, client="a")
+
+    def follower():
+        time.sleep(0.03)
+        turns["follower"] = engine.respond(QUESTION, client="b")
+
+    _in_threads(leader, follower)
+    assert turns["leader"].source == "kb_fallback"
+    assert turns["follower"].source == "llm"
+    assert cfg.requests == 1
+    assert calls == [None, None]    # both clients were charged before joining
+
+
+def test_followers_pay_their_own_client(mock_groq, make_engine):
+    url, cfg = mock_groq(ttfb_ms=100, tokens=5)
+    admission = AdmissionController(client_rpm=1, client_burst=1)
+    engine = make_engine(url, cache=False, flights=SingleFlight(), admission=admission)
+    admission.clients.try_acquire("spent")
+    turns = {}
+
+    def leader():
+        turns["leader"] = engine.respond(QUESTION, client="fresh")
+
+    def follower():
+        time.sleep(0.03)
+        turns["follower"] = engine.respond(QUESTION, client="spent")
+
+    _in_threads(leader, follower)
+    assert turns["leader"].source == "llm"
+    assert turns["follower"].source == "kb_fallback" and not turns["follower"].shared
+    assert cfg.requests == 1
+
+
+def test_kb_reload_drops_stale_cached_replies(mock_groq, make_engine, tmp_path):
+    url, _ = mock_groq(tokens=5)
+    engine = make_engine(url)
+    with open(KB_FILE, encoding="utf-8") as f:
+        kb = json.load(f)
+    kb_path = tmp_path / "kb.json"
+    kb_path.write_text(json.dumps(kb), encoding="utf-8")
+
+    turn = engine.respond(QUESTION)
+    assert turn.source == "llm" and engine.respond(QUESTION).source == "cache"
+    by_pid = {p.pid: p for p in engine.index.passages}
+    section = by_pid[turn.retrieval.ctx_ids[0]].section
+
+    # edit every string of the section the first reply was grounded on
+    def touch(value):
+        if isinstance(value, str):
+            return value + " (updated)"
+        if isinstance(value, list):
+            return [touch(v) for v in value]
+        if isinstance(value, dict):
+            return {k: v if k == "id" else touch(v) for k, v in value.items()}
+        return value
+    for sec in kb["v_mitra_knowledge_base"]["sections"]:
+        if sec["id"] == section:
+            sec.update(touch(sec))
+    kb_path.write_text(json.dumps(kb), encoding="utf-8")
+
+    assert len(engine.cache.backend) == 1
+    watcher = KBWatcher(engine, str(kb_path), "test-hash", index_dir=str(tmp_path / "idx"))
+    assert watcher.reload()
+    assert engine.kb_generation == 1
+    assert len(engine.cache.backend) == 0       # grounded on an edited passage
+    assert engine.respond(QUESTION).source == "llm"
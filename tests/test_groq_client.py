@@ -0,0 +1,86 @@
+import pytest
+
+from groq_client import (CircuitBreaker, GroqClient, GroqStreamError, GroqUnavailable,
+                         iter_sse_events, retry_after_seconds)
+
+PAYLOAD = {"model": "test", "messages": [{"role": "user", "content": "hi"}]}
+
+
+def test_sse_events_split_across_chunks():
+    raw = ('data: {"a": 1}\r\n\r\n: keep-alive\n\ndata: {"b":\ndata: "नमस्ते"}\n\n'
+           'data: [DONE]\n\ndata: {"never": 1}\n\n').encode("utf-8")
+    # one byte at a time cuts every event and every multi-byte character
+    chunks = [raw[i:i + 1] for i in range(len(raw))]
+    assert list(iter_sse_events(chunks)) == ['{"a": 1}', '{"b":\n"नमस्ते"}']
+
+
+def test_sse_event_without_trailing_blank_line():
+    assert list(iter_sse_events([b'data: {"a": 1}\n\ndata: {"b": 2}'])) == ['{"a": 1}', '{"b": 2}']
+
+
+def test_stream_deltas_and_usage(mock_groq):
+    url, cfg = mock_groq(tokens=5)
+    client = GroqClient("test", url)
+    with client.stream(PAYLOAD) as stream:
+        deltas = list(stream)
+    assert len(deltas) == 5
+    assert "".join(deltas) == stream.text
+    assert stream.done and stream.finish_reason == "stop"
+    assert stream.usage["completion_tokens"] == 5
+
+
+def test_stream_cut_mid_reply_keeps_partial(mock_groq):
+    url, _ = mock_groq(tokens=10, break_after=3)
+    client = GroqClient("test", url)
+    received = []
+    with pytest.raises(GroqStreamError) as e:
+        with client.stream(PAYLOAD) as stream:
+            for delta in stream:
+                received.append(delta)
+    assert len(received) == 3
+    assert e.value.partial == "".join(received)
+
+
+def test_retry_after_is_honoured(mock_groq):
+    url, cfg = mock_groq(tokens=3, fail_first=2, fail_status=429, retry_after=3)
+    slept = []
+    client = GroqClient("test", url, backoff_base=0.1, sleep=slept.append)
+    assert client.complete(PAYLOAD)
+    assert cfg.requests == 3
+    assert len(slept) == 2 and all(3 <= s <= 3.1 for s in slept)
+
+
+def test_long_retry_after_gives_up_at_once(mock_groq):
+    url, cfg = mock_groq(fail_first=5, fail_status=429, retry_after=120)
+    client = GroqClient("test", url, max_retry_after=20, sleep=lambda s: None)
+    with pytest.raises(GroqUnavailable):
+        client.complete(PAYLOAD)
+    assert cfg.requests == 1
+
+
+def test_retry_after_http_date():
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:28:10 GMT", now=1445412480.0) == 10.0
+    assert retry_after_seconds("soon") is None
+
+
+def test_circuit_breaker_opens_and_probes(mock_groq):
+    url, cfg = mock_groq(fail_first=3, fail_status=503)
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_after=30, clock=lambda: now[0])
+    client = GroqClient("test", url, max_retries=0, breaker=breaker, sleep=lambda s: None)
+    for _ in range(2):
+        with pytest.raises(GroqUnavailable):
+            client.complete(PAYLOAD)
+    assert breaker.state == "open"
+    with pytest.raises(GroqUnavailable):
+        client.complete(PAYLOAD)
+    assert cfg.requests == 2            # refused without a request
+
+    now[0] = 31.0                       # half open: one probe, which fails again
+    with pytest.raises(GroqUnavailable):
+        client.complete(PAYLOAD)
+    assert cfg.requests == 3 and breaker.state == "open"
+
+    now[0] = 62.0                       # next probe succeeds and closes the circuit
+    assert client.complete(PAYLOAD)
+    assert breaker.state == "closed"
@@ -0,0 +1,20 @@
+import pytest
+
+from lang import detect_language
+
+
+@pytest.mark.parametrize("text, lang", [
+    ("how do I register", "en"),
+    ("reward points", "en"),
+    ("IVRS number", "en"),
+    ("Hello", "en"),
+    ("app kaise download karein", "hinglish"),
+    ("Bank account jodna", "hinglish"),
+    ("app kasa download karu", "mr"),
+    ("ऐप कैसे डाउनलोड करें", "hi"),
+    ("मला ॲप कसे डाउनलोड करायचे आहे", "mr"),
+    ("એપ કેવી રીતે ડાઉનલોડ કરવી", "other"),
+    ("میرا بل", "other"),
+])
+def test_detect_language(text, lang):
+    assert detect_language(text) == lang
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+import warmset
+from warmset import WarmSet, _refresh_lock, refresh_warmset, save_warmset, table_key
+
+from conftest import KB_FILE
+
+
+def _wait_for(predicate, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+@pytest.mark.skipif(warmset.fcntl is None, reason="no cross-process lock on this platform")
+def test_refresh_waits_for_the_lock_holders_table(mock_groq, make_engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(warmset, "REFRESH_POLL", 0.05)
+    url, cfg = mock_groq(tokens=3)
+    engine = make_engine(url)
+    key = table_key(KB_FILE, engine.model)
+    with _refresh_lock(str(tmp_path)) as owner:
+        assert owner                # another worker is regenerating
+        refresh_warmset(engine, KB_FILE, str(tmp_path), refresh=True, rps=0)
+        assert engine.warmset.key == key
+        time.sleep(0.2)
+        assert cfg.requests == 0
+        save_warmset(WarmSet(key, {"x": {"hi": {"answer": "नमस्ते", "digest": "d"}}}, {},
+                             engine.model), str(tmp_path))
+    _wait_for(lambda: engine.warmset.get("x", "hi") == "नमस्ते")
+    assert cfg.requests == 0
+
+
+def test_refresh_regenerates_once_under_the_lock(mock_groq, make_engine, tmp_path):
+    url, cfg = mock_groq(tokens=3)
+    engine = make_engine(url)
+    refresh_warmset(engine, KB_FILE, str(tmp_path), refresh=True, rps=0)
+    _wait_for(lambda: warmset.load_warmset(KB_FILE, str(tmp_path), engine.model) is not None)
+    jobs = cfg.requests
+    assert jobs > 0
+    # a second worker finds the saved table and calls nothing
+    other = make_engine(url)
+    refresh_warmset(other, KB_FILE, str(tmp_path), refresh=True, rps=0)
+    assert other.warmset.key == table_key(KB_FILE, engine.model)
+    assert cfg.requests == jobs
+
+
+def test_refresh_is_off_by_default(mock_groq, make_engine, tmp_path):
+    url, cfg = mock_groq(tokens=3)
+    engine = make_engine(url)
+    refresh_warmset(engine, KB_FILE, str(tmp_path))
+    time.sleep(0.2)
+    assert cfg.requests == 0
@@ -0,0 +1,453 @@
+"""
+Pre-generated answers for the KB's intent questions, per language.
+
+The intent examples in `sample_intents_entities` are a small, stable set and
+come with a curated English answer only, so every Hindi, Hinglish or Marathi
+question that matches one still went to Groq. This job runs each example
+through the normal pipeline (retrieval → PromptBuilder with that language's
+system prompt → Groq) once per language, has Groq write a few paraphrases of
+it in each language, and stores both in a table tied to the KB hash:
+
+    <WARMSET_DIR>/warmset-<key[:16]>.json
+        {"version", "key", "model", "created",
+         "answers":     {pid: {lang: {"answer", "digest"}}},
+         "paraphrases": {pid: {"digest", "texts": [[lang, text], …]}}}
+
+At serving time the stored reply in the user's language is returned instantly
+when the query is a confident intent match (same thresholds as the direct KB
+answer) or lies close to one of the paraphrases – the English-only embedder
+rarely matches a Hindi question to the English example itself. Languages
+with a curated answer (English always) are not generated; a paraphrase match
+there serves the curated answer. `digest` is the hash of the exact prompt an
+entry came from: when the KB changes, entries whose prompt is byte-identical
+under the new KB are carried over. The rest are regenerated by `build`, or
+with VMITRA_WARMSET_REFRESH=1 in the background by the KB watcher: one
+process per warm-set directory (an exclusive lock file) calls Groq, under the
+same kind of rate limit as `build`, and the other workers pick the new table
+up from disk.
+
+    python warmset.py build --rps 2          # after editing the KB
+    python warmset.py coverage               # corpus paraphrases served instantly
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:         # Windows: no cross-process lock, every worker regenerates
+    fcntl = None
+
+import numpy as np
+
+from groq_client import LLM_MODEL
+from kb_index import KB_PATH, encode_queries
+from lang import detect_language
+
+log = logging.getLogger("vmitra.warmset")
+
+WARMSET_DIR     = os.getenv("VMITRA_WARMSET_DIR", ".vmitra_warmset")
+WARMSET_REFRESH = os.getenv("VMITRA_WARMSET_REFRESH", "0") != "0"   # regenerate on KB reload
+REFRESH_RPS     = float(os.getenv("VMITRA_WARMSET_REFRESH_RPS", "0.5"))  # Groq calls per second
+REFRESH_POLL    = 15.0      # seconds between checks for another worker's table
+WARM_THRESHOLD  = float(os.getenv("VMITRA_WARM_THRESHOLD", "0.88"))  # query ↔ paraphrase cosine
+WARM_MARGIN     = 0.04      # over the best paraphrase of any other example
+TABLE_VERSION   = 1
+LANGS           = ("en", "hi", "hinglish", "mr")
+PARAPHRASES     = 4         # per language and example
+
+# appended to the KB question, which is in English whatever the system prompt
+DIRECTIVES = {
+    "en":       "Please answer in English.",
+    "hi":       "कृपया हिंदी में (देवनागरी लिपि में) जवाब दें।",
+    "hinglish": "Please answer in Hinglish – Hindi written in Roman script, "
+                "the way people type it on WhatsApp.",
+    "mr":       "कृपया मराठीत (देवनागरी लिपीत) उत्तर द्या.",
+}
+LANG_NAMES = {"en": "English", "hi": "Hindi (Devanagari script)",
+              "hinglish": "Hinglish (Hindi written in Roman script)",
+              "mr": "Marathi (Devanagari script)"}
+PARAPHRASE_PROMPT = """A user of the V-Mitra app asks:
+
+{question}
+
+Write {n} different ways a user might ask exactly the same thing in each of:
+{languages}. Reply with only a JSON object mapping {keys} to lists of strings."""
+
+
+def table_key(kb_path=KB_PATH, model=LLM_MODEL):
+    h = hashlib.sha256()
+    with open(kb_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    h.update(f"|{model}|v{TABLE_VERSION}".encode())
+    return h.hexdigest()
+
+
+def _table_path(key, warm_dir=WARMSET_DIR):
+    return os.path.join(warm_dir, f"warmset-{key[:16]}.json")
+
+
+class WarmSet:
+    def __init__(self, key, answers=None, paraphrases=None, model=LLM_MODEL):
+        self.key = key
+        self.model = model
+        self.answers = answers or {}            # pid -> {lang: {"answer", "digest"}}
+        self.paraphrases = paraphrases or {}    # pid -> {"digest", "texts": [[lang, text]]}
+        self._vecs, self._owners = None, []
+
+    def embed(self, embedder):
+        """Encode the paraphrases once so match() is a single matrix product."""
+        owners = [pid for pid, entry in self.paraphrases.items() for _ in entry["texts"]]
+        texts = [text for entry in self.paraphrases.values() for _, text in entry["texts"]]
+        self._vecs = encode_queries(embedder, texts) if texts else None
+        self._owners = owners
+        return self
+
+    def get(self, pid, lang):
+        entry = self.answers.get(pid, {}).get(lang)
+        return entry["answer"] if entry else None
+
+    def match(self, qv, threshold=WARM_THRESHOLD, margin=WARM_MARGIN):
+        """Example pid whose paraphrases the query clearly matches, else None."""
+        if self._vecs is None:
+            return None
+        sims = self._vecs @ qv
+        best = int(np.argmax(sims))
+        if sims[best] < threshold:
+            return None
+        pid = self._owners[best]
+        others = [s for s, owner in zip(sims, self._owners) if owner != pid]
+        if others and sims[best] - max(others) < margin:
+            return None
+        return pid
+
+    def __len__(self):
+        return sum(len(langs) for langs in self.answers.values())
+
+
+def save_warmset(ws, warm_dir=WARMSET_DIR):
+    """Write atomically and drop tables of older KB versions."""
+    os.makedirs(warm_dir, exist_ok=True)
+    path = _table_path(ws.key, warm_dir)
+    fd, tmp = tempfile.mkstemp(dir=warm_dir, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"version": TABLE_VERSION, "key": ws.key, "model": ws.model,
+                   "created": time.time(), "answers": ws.answers,
+                   "paraphrases": ws.paraphrases}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    for name in os.listdir(warm_dir):
+        if name.startswith("warmset-") and os.path.join(warm_dir, name) != path:
+            os.remove(os.path.join(warm_dir, name))
+    return path
+
+
+def load_warmset(kb_path=KB_PATH, warm_dir=WARMSET_DIR, model=LLM_MODEL, embedder=None):
+    """The table for the current KB (embedded if `embedder` is given), or None."""
+    key = table_key(kb_path, model)
+    try:
+        with open(_table_path(key, warm_dir), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != TABLE_VERSION or data.get("key") != key:
+        return None
+    ws = WarmSet(key, data["answers"], data.get("paraphrases"), data.get("model", model))
+    return ws.embed(embedder) if embedder is not None else ws
+
+
+def _latest_table(warm_dir=WARMSET_DIR):
+    """Most recent table on disk whatever its KB version (for carrying answers over)."""
+    try:
+        names = [n for n in os.listdir(warm_dir) if n.startswith("warmset-")]
+    except OSError:
+        return None
+    if not names:
+        return None
+    path = max((os.path.join(warm_dir, n) for n in names), key=os.path.getmtime)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return WarmSet(data.get("key", ""), data.get("answers"), data.get("paraphrases"),
+                   data.get("model", LLM_MODEL))
+
+
+# ────────────────────────────────
+# Generation
+# ────────────────────────────────
+def _digest(model, messages):
+    return hashlib.sha1(json.dumps([model, messages], ensure_ascii=False)
+                        .encode("utf-8")).hexdigest()
+
+
+def plan(engine, langs=LANGS):
+    """
+    Jobs as (kind, pid, lang, messages, digest): an "answer" per intent example
+    and language without a curated answer, and one "paraphrase" per example.
+    """
+    jobs = []
+    keys = ", ".join(f'"{lang}"' for lang in langs)
+    names = ", ".join(LANG_NAMES[lang] for lang in langs)
+    for p in engine.index.passages:
+        if p.kind != "qa":
+            continue
+        r = engine.retrieve(p.text)
+        for lang in langs:
+            if p.answer_in(lang):
+                continue
+            messages = engine.prompts.build(r.hits, f"{p.text}\n\n{DIRECTIVES[lang]}",
+                                            lang=lang).messages
+            jobs.append(("answer", p.pid, lang, messages, _digest(engine.model, messages)))
+        messages = [{"role": "user", "content": PARAPHRASE_PROMPT.format(
+            question=p.text, n=PARAPHRASES, languages=names, keys=keys)}]
+        jobs.append(("paraphrase", p.pid, None, messages, _digest(engine.model, messages)))
+    return jobs
+
+
+def carry_over(jobs, previous):
+    """(answers, paraphrases) reused from `previous` whose prompt is unchanged, jobs still to run."""
+    answers, paraphrases, missing = {}, {}, []
+    for job in jobs:
+        kind, pid, lang, _, digest = job
+        if previous is None:
+            entry = None
+        elif kind == "answer":
+            entry = previous.answers.get(pid, {}).get(lang)
+        else:
+            entry = previous.paraphrases.get(pid)
+        if entry and entry.get("digest") == digest:
+            if kind == "answer":
+                answers.setdefault(pid, {})[lang] = entry
+            else:
+                paraphrases[pid] = entry
+        else:
+            missing.append(job)
+    return answers, paraphrases, missing
+
+
+def _parse_paraphrases(text, langs):
+    """[[lang, text]] from the model's JSON, keeping only texts really in that language."""
+    try:
+        data = json.loads(text[text.index("{"):text.rindex("}") + 1])
+    except ValueError:
+        return []
+    out = []
+    for lang in langs:
+        for item in data.get(lang) or []:
+            if isinstance(item, str) and item.strip() and detect_language(item) == lang:
+                out.append([lang, item.strip()])
+    return out
+
+
+def generate(engine, jobs, workers=4, limiter=None, langs=LANGS):
+    """Run jobs through Groq; returns (answers, paraphrases, failures)."""
+    answers, paraphrases, failures = {}, {}, []
+    lock = threading.Lock()
+
+    def one(job):
+        kind, pid, lang, messages, digest = job
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            text = engine.groq.completion({"model": engine.model,
+                                           "messages": messages}).text.strip()
+        except Exception as e:
+            log.warning("%s %s [%s]: %s", kind, pid, lang or "all", e)
+            failures.append((kind, pid, lang, repr(e)))
+            return
+        if kind == "paraphrase":
+            texts = _parse_paraphrases(text, langs)
+            if not texts:
+                log.warning("paraphrases for %s: no usable JSON", pid)
+                failures.append((kind, pid, lang, "parse"))
+                return
+            with lock:
+                paraphrases[pid] = {"digest": digest, "texts": texts}
+            return
+        # a reply in the wrong language would be served to the wrong people
+        if not text or detect_language(text) != lang:
+            log.warning("%s [%s]: reply came back as %s, not stored", pid, lang,
+                        detect_language(text) if text else "empty")
+            failures.append((kind, pid, lang, "language"))
+            return
+        with lock:
+            answers.setdefault(pid, {})[lang] = {"answer": text, "digest": digest}
+
+    with ThreadPoolExecutor(workers, thread_name_prefix="warmset") as pool:
+        list(pool.map(one, jobs))
+    return answers, paraphrases, failures
+
+
+def _merge(a, b):
+    out = {pid: dict(langs) for pid, langs in a.items()}
+    for pid, langs in b.items():
+        out.setdefault(pid, {}).update(langs)
+    return out
+
+
+def build_warmset(engine, kb_path=KB_PATH, langs=LANGS, workers=4, limiter=None,
+                  previous=None, force=False, warm_dir=WARMSET_DIR):
+    """Carry over what is still valid, generate the rest, save; returns (WarmSet, stats)."""
+    jobs = plan(engine, langs)
+    answers, paraphrases, missing = carry_over(jobs, None if force else previous)
+    new_answers, new_paraphrases, failures = generate(engine, missing, workers, limiter, langs)
+    ws = WarmSet(table_key(kb_path, engine.model), _merge(answers, new_answers),
+                 {**paraphrases, **new_paraphrases}, engine.model)
+    save_warmset(ws, warm_dir)
+    stats = {"jobs": len(jobs), "reused": len(jobs) - len(missing),
+             "generated": len(missing) - len(failures), "failed": len(failures),
+             "paraphrases": sum(len(e["texts"]) for e in ws.paraphrases.values())}
+    return ws, stats
+
+
+@contextmanager
+def _refresh_lock(warm_dir=WARMSET_DIR):
+    """True when this process got the directory's refresh lock, False when another holds it."""
+    os.makedirs(warm_dir, exist_ok=True)
+    with open(os.path.join(warm_dir, ".refresh.lock"), "a") as f:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def refresh_warmset(engine, kb_path=KB_PATH, warm_dir=WARMSET_DIR, refresh=WARMSET_REFRESH,
+                    rps=REFRESH_RPS):
+    """
+    After a KB reload: install the still-valid entries right away, then (with
+    `refresh`) have one worker regenerate the rest on a background thread,
+    at most `rps` Groq calls a second, while the others wait for its table.
+    """
+    previous = engine.warmset
+    key = table_key(kb_path, engine.model)
+    stored = load_warmset(kb_path, warm_dir, engine.model, engine.embedder)
+    if stored is not None:
+        engine.warmset = stored
+        return
+    answers, paraphrases, missing = carry_over(plan(engine), previous)
+    engine.warmset = WarmSet(key, answers, paraphrases, engine.model).embed(engine.embedder)
+    log.info("warm-set: %d answers carried over, %d jobs to regenerate", len(engine.warmset),
+             len(missing))
+    if not missing or not refresh:
+        return
+
+    def current():
+        return engine.warmset is not None and engine.warmset.key == key
+
+    def regenerate():
+        from batch_answer import RateLimiter
+        limiter = RateLimiter(rps) if rps > 0 else None
+        new_answers, new_paraphrases, failures = generate(engine, missing, workers=2,
+                                                          limiter=limiter)
+        ws = WarmSet(key, _merge(answers, new_answers), {**paraphrases, **new_paraphrases},
+                     engine.model)
+        save_warmset(ws, warm_dir)
+        log.info("warm-set regenerated: %d answers (%d jobs failed)", len(ws), len(failures))
+        return ws
+
+    def run():
+        while current():            # stop if the KB changed again meanwhile
+            with _refresh_lock(warm_dir) as owner:
+                # the previous owner may have saved it just before letting go
+                stored = load_warmset(kb_path, warm_dir, engine.model)
+                if owner and stored is None:
+                    stored = regenerate()
+            if stored is not None:
+                if current():
+                    engine.warmset = stored.embed(engine.embedder)
+                return
+            time.sleep(REFRESH_POLL)
+    threading.Thread(target=run, name="warmset-refresh", daemon=True).start()
+
+
+# ────────────────────────────────
+# CLI
+# ────────────────────────────────
+def coverage(engine, corpus_path=os.path.join("bench", "corpus.jsonl")):
+    """
+    Per language: how many corpus paraphrases are answered without an LLM call
+    (curated or warm-set), and how many of those went to a non-relevant example.
+    """
+    from eval_retrieval import is_relevant
+
+    counts = {}
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    for row in rows:
+        r = engine.retrieve(row["query"])
+        top = engine._confident_intent(r)
+        if engine.direct_answer(r):
+            source, pid = "kb_direct", top.pid
+        elif engine.warm_answer(r):
+            source, pid = "warm", top.pid if top else engine.warmset.match(r.qv)
+        else:
+            source, pid = "llm", None
+        c = counts.setdefault(row["lang"], {"kb_direct": 0, "warm": 0, "llm": 0, "wrong": 0})
+        c[source] += 1
+        c["wrong"] += bool(pid) and not is_relevant(pid, row["relevant"])
+    return counts
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Pre-generated multilingual answers for KB intents")
+    sub = ap.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="generate (or refresh) the table for the current KB")
+    b.add_argument("--kb", default=KB_PATH)
+    b.add_argument("--langs", default=",".join(LANGS))
+    b.add_argument("--workers", type=int, default=4)
+    b.add_argument("--rps", type=float, default=2.0, help="max Groq requests per second")
+    b.add_argument("--force", action="store_true", help="regenerate even unchanged answers")
+    c = sub.add_parser("coverage", help="how many corpus paraphrases skip the LLM")
+    c.add_argument("--kb", default=KB_PATH)
+    args = ap.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key and args.command == "build":
+        raise SystemExit("❌ Please set the GROQ_API_KEY in your .env")
+
+    os.environ["VMITRA_KB_WATCH"] = "0"
+    from engine import build_engine
+    engine = build_engine(api_key or "", kb_path=args.kb)
+
+    if args.command == "coverage":
+        for lang, c in sorted(coverage(engine).items()):
+            total = c["kb_direct"] + c["warm"] + c["llm"]
+            print(f"{lang:<9} {total:>3} queries: {c['kb_direct']:>3} curated, "
+                  f"{c['warm']:>3} warm-set, {c['llm']:>3} LLM, {c['wrong']:>3} wrong example")
+        return 0
+
+    from batch_answer import RateLimiter
+    langs = [lang for lang in args.langs.split(",") if lang]
+    previous = engine.warmset or _latest_table()
+    t0 = time.perf_counter()
+    ws, stats = build_warmset(engine, args.kb, langs, args.workers,
+                              RateLimiter(args.rps) if args.rps > 0 else None,
+                              previous, args.force)
+    print(json.dumps({**stats, "answers": len(ws), "key": ws.key[:16],
+                      "seconds": round(time.perf_counter() - t0, 1)}, indent=2))
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())